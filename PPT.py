@@ -1,22 +1,59 @@
-from flask import Flask, request, send_file, jsonify
+from flask import Flask, Request, request, send_file, jsonify, Response, stream_with_context, g, has_request_context
 from flask_cors import CORS
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import Gone, HTTPException, RequestEntityTooLarge
+import io
 from io import BytesIO
-import openpyxl
+import pptx
 from pptx import Presentation
-from pptx.util import Pt
-from pptx.dml.color import RGBColor
-from pptx.enum.dml import MSO_COLOR_TYPE
+from pptx.chart.data import CategoryChartData
+from pptx.enum.chart import XL_CHART_TYPE, XL_LEGEND_POSITION
+from pptx.enum.shapes import PP_PLACEHOLDER
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.opc.package import _Relationship
+from pptx.util import lazyproperty
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls, qn
+from xml.sax.saxutils import escape as escapar_xml
 import os
-import locale
+import functools
+import math
+import mmap
 import traceback
 import base64
 import tempfile
 import subprocess
-import pythoncom
-import win32com.client as win32
-from pdf2image import convert_from_path
-from PIL import Image
+import zipfile
+import queue
+import atexit
+import shutil
+import socket
+import pathlib
+import time
+import concurrent.futures
+import posixpath
+from collections import namedtuple, OrderedDict
+import datetime
+from xml.etree import ElementTree
+from xml.etree.ElementTree import iterparse
+from PIL import Image, ImageOps
 import json
+import re
+import bisect
+import copy
+import hashlib
+import threading
+import logging
+import contextlib
+import cProfile
+import argparse
+import sys
+import multiprocessing
+import uuid
+from openpyxl.reader.strings import read_string_table
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import coordinate_to_tuple, range_boundaries, range_to_tuple
+from openpyxl.utils.datetime import from_excel, from_ISO8601, WINDOWS_EPOCH, MAC_EPOCH
 
 # ===================================================================
 # CONFIGURAÇÕES
@@ -25,351 +62,3047 @@ import json
 app = Flask(__name__)
 CORS(app)
 
-try:
-    locale.setlocale(locale.LC_ALL, 'pt_BR.UTF-8')
-except locale.Error:
-    print("Aviso: localidade pt_BR.UTF-8 não encontrada. Usando fallback.")
+# Caminhos externos - AJUSTE ESTES CAMINHOS PARA O SEU AMBIENTE
+POPPLER_PATH = r"C:\Users\fixxi\Desktop\STYLUX_PPTGEN\Back\POPPLER\Library\bin"
+LIBREOFFICE_PATH = r"C:\Program Files\LibreOffice\program\soffice.exe"
+
+# Pool de conversão para PDF: instâncias do LibreOffice, tamanho da fila de espera,
+# portas UNO (uma por instância; 0 = portas livres escolhidas pelo sistema), tempo
+# máximo por conversão e intervalo do health check
+LIBREOFFICE_WORKERS = int(os.environ.get("LIBREOFFICE_WORKERS", "2"))
+LIBREOFFICE_FILA_MAXIMA = int(os.environ.get("LIBREOFFICE_FILA_MAXIMA", "8"))
+LIBREOFFICE_PORTA_INICIAL = int(os.environ.get("LIBREOFFICE_PORTA_INICIAL", "2002"))
+LIBREOFFICE_TIMEOUT = 60
+LIBREOFFICE_INTERVALO_SAUDE = 10
+
+# Limite de memória do cache de imagens de slides já renderizadas (pré-visualização)
+PREVIEW_CACHE_BYTES = int(os.environ.get("PREVIEW_CACHE_MB", "256")) * 1024 * 1024
+# Rasterização das miniaturas: resolução, formato (JPEG, WEBP ou PNG) e páginas em paralelo.
+# A imagem em tamanho real de um slide é pedida à parte (campo `slide`, até PREVIEW_DPI_MAXIMO)
+PREVIEW_DPI = int(os.environ.get("PREVIEW_DPI", "60"))
+PREVIEW_DPI_MAXIMO = 200
+PREVIEW_FORMATO = os.environ.get("PREVIEW_FORMATO", "JPEG").upper()
+PREVIEW_QUALIDADE = 80
+PREVIEW_THREADS = int(os.environ.get("PREVIEW_THREADS", "4"))
+FORMATOS_PREVIEW = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+# Motor das miniaturas: "uno" exporta cada slide direto como imagem na instância do
+# LibreOffice, com o deck entrando e as imagens saindo em memória; "pdf" converte para
+# PDF e rasteriza com o poppler. "auto" usa o UNO quando o módulo está disponível.
+PREVIEW_MOTOR = os.environ.get("PREVIEW_MOTOR", "auto").lower()
+# Arquivos temporários da conversão (.pptx e PDF do motor "pdf"): em memória quando há /dev/shm
+DIRETORIO_TEMPORARIO = os.environ.get("DIRETORIO_TEMPORARIO") or ("/dev/shm" if os.access("/dev/shm", os.W_OK) else None)
+
+# Uploads: tamanho máximo da requisição e do logo. Requisições de até UPLOAD_MEMORIA_BYTES
+# ficam em memória; acima disso os arquivos vão direto para o DIRETORIO_TEMPORARIO e são
+# lidos via mmap
+UPLOAD_LIMITE_BYTES = int(os.environ.get("UPLOAD_LIMITE_MB", "50")) * 1024 * 1024
+LOGO_LIMITE_BYTES = int(os.environ.get("LOGO_LIMITE_MB", "10")) * 1024 * 1024
+UPLOAD_MEMORIA_BYTES = int(os.environ.get("UPLOAD_MEMORIA_MB", "4")) * 1024 * 1024
+
+# Sessões de planilha: o /extract devolve um token que /preview, /generate e /jobs aceitam
+# no lugar do arquivo. Memória máxima (estimada) e tempo sem uso até a sessão expirar
+SESSOES_PLANILHA_BYTES = int(os.environ.get("SESSOES_PLANILHA_MB", "256")) * 1024 * 1024
+SESSOES_PLANILHA_TTL = int(os.environ.get("SESSOES_PLANILHA_TTL", "1800"))
+
+# Logo do cliente ({{LOGOCLIENTE}}): resolução na maior caixa do modelo, qualidade do
+# JPEG, até quantas cores o logo vai em PNG e memória do cache de logos já preparados
+LOGO_DPI = int(os.environ.get("LOGO_DPI", "150"))
+LOGO_QUALIDADE = 85
+LOGO_CORES_PNG = 256
+LOGO_CACHE_BYTES = int(os.environ.get("LOGO_CACHE_MB", "32")) * 1024 * 1024
+
+# Cache de resultados por entrada (.pptx final e lista de slides do preview). Com
+# RESULTADOS_CACHE_DIR definido, os resultados e as imagens dos slides também são
+# mantidos em disco; RESULTADOS_CACHE_DISCO_MB é o total em disco, dividido ao meio
+# entre os resultados e as imagens. As chaves incluem a versão do código (ver
+# VERSAO_CODIGO), então um deploy não reaproveita resultados gerados pelo código anterior.
+RESULTADOS_CACHE_BYTES = int(os.environ.get("RESULTADOS_CACHE_MB", "256")) * 1024 * 1024
+RESULTADOS_CACHE_DIR = os.environ.get("RESULTADOS_CACHE_DIR", "")
+RESULTADOS_CACHE_DISCO_BYTES = int(os.environ.get("RESULTADOS_CACHE_DISCO_MB", "2048")) * 1024 * 1024
+
+# Jobs assíncronos (/jobs): processos que montam as apresentações, limite de jobs
+# pendentes (na fila ou em execução), por quanto tempo um job finalizado fica disponível
+# e memória máxima dos resultados guardados (acima dela, os jobs finalizados há mais
+# tempo são descartados antes do TTL)
+JOBS_PROCESSOS = int(os.environ.get("JOBS_PROCESSOS", "2"))
+JOBS_FILA_MAXIMA = int(os.environ.get("JOBS_FILA_MAXIMA", "16"))
+JOBS_TTL = 600
+JOBS_RESULTADOS_BYTES = int(os.environ.get("JOBS_RESULTADOS_MB", "256")) * 1024 * 1024
+# Quantos jobs cada processo do pool monta antes de ser substituído por um novo (0 = nunca).
+# A reciclagem limita o crescimento de memória
+JOBS_TAREFAS_POR_PROCESSO = int(os.environ.get("JOBS_TAREFAS_POR_PROCESSO", "0"))
+
+# Geração em lote (/lote e "python PPT.py lote"): processos e linhas da planilha por tarefa
+LOTE_PROCESSOS = int(os.environ.get("LOTE_PROCESSOS", str(os.cpu_count() or 1)))
+LOTE_LINHAS_POR_TAREFA = 8
+# Lotes gerados ao mesmo tempo pelo /lote (cada um com até LOTE_PROCESSOS processos) e
+# tamanho máximo, já descompactado, do conteúdo de um .zip de planilhas
+LOTE_SIMULTANEOS = int(os.environ.get("LOTE_SIMULTANEOS", "1"))
+LOTE_DESCOMPACTADO_LIMITE_BYTES = int(os.environ.get("LOTE_DESCOMPACTADO_LIMITE_MB", "200")) * 1024 * 1024
+
+# Servidor de produção ("python PPT.py servir" ou "gunicorn -c gunicorn.conf.py"): endereço,
+# processos (criados por fork a partir de um mestre já aquecido), threads por processo,
+# requisições atendidas por processo antes de ser reciclado (0 = nunca) e tempo máximo por requisição.
+# Jobs e sessões de planilha vivem na memória do processo: por padrão há um único processo,
+# nunca reciclado, e o paralelismo vem das threads e dos pools de jobs, lote e LibreOffice
+SERVIDOR_ENDERECO = os.environ.get("SERVIDOR_ENDERECO", "127.0.0.1:5000")
+SERVIDOR_PROCESSOS = int(os.environ.get("SERVIDOR_PROCESSOS", "1"))
+SERVIDOR_THREADS = int(os.environ.get("SERVIDOR_THREADS", "8"))
+SERVIDOR_MAX_REQUISICOES = int(os.environ.get("SERVIDOR_MAX_REQUISICOES", "0"))
+SERVIDOR_TIMEOUT = int(os.environ.get("SERVIDOR_TIMEOUT", "300"))
+
+# Perfil por requisição: com PERFIL_DIR definido, uma requisição com o cabeçalho
+# "X-Perfil: cprofile" (ou "pyinstrument", se instalado) grava o perfil nesse diretório
+PERFIL_DIR = os.environ.get("PERFIL_DIR", "")
+
+MODELO_PATH = os.environ.get("MODELO_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates_ppt", "modeloprincipal3.pptx")
+
+# ===================================================================
+# MÉTRICAS E RASTREAMENTO
+# ===================================================================
+
+logger = logging.getLogger("propostas")
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histograma:
+    """Histograma cumulativo no formato do Prometheus, com uma série por combinação de rótulos."""
+
+    def __init__(self, nome, descricao, rotulos, buckets=BUCKETS_SEGUNDOS):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = rotulos
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *valores_rotulos):
+        with self._lock:
+            serie = self._series.get(valores_rotulos)
+            if serie is None:
+                serie = self._series[valores_rotulos] = [[0] * len(self.buckets), 0, 0.0]
+            contagens = serie[0]
+            for i in range(bisect.bisect_left(self.buckets, valor), len(self.buckets)):
+                contagens[i] += 1
+            serie[1] += 1
+            serie[2] += valor
+
+    def exportar(self):
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} histogram"]
+        with self._lock:
+            series = sorted((chave, (list(s[0]), s[1], s[2])) for chave, s in self._series.items())
+        for valores_rotulos, (contagens, total, soma) in series:
+            rotulos = ",".join(f'{nome}="{valor}"' for nome, valor in zip(self.rotulos, valores_rotulos))
+            separador = "," if rotulos else ""
+            for limite, contagem in zip(self.buckets, contagens):
+                linhas.append(f'{self.nome}_bucket{{{rotulos}{separador}le="{limite}"}} {contagem}')
+            linhas.append(f'{self.nome}_bucket{{{rotulos}{separador}le="+Inf"}} {total}')
+            linhas.append(f"{self.nome}_sum{{{rotulos}}} {soma}")
+            linhas.append(f"{self.nome}_count{{{rotulos}}} {total}")
+        return linhas
+
+
+histograma_etapas = Histograma(
+    "proposta_etapa_segundos", "Duração de cada etapa da montagem e da conversão das propostas.", ("etapa",))
+histograma_requisicoes = Histograma(
+    "http_requisicao_segundos", "Duração das requisições HTTP por endpoint e status.", ("endpoint", "status"))
+
+
+def rastreamento_atual():
+    """(início, lista de spans) da requisição em andamento, para levar a threads auxiliares; ou None."""
+    if has_request_context() and "spans" in g:
+        return g.inicio, g.spans
+    return None
+
+
+@contextlib.contextmanager
+def medir_etapa(etapa, rastreamento=None):
+    """
+    Mede a duração de uma etapa: alimenta o histograma de etapas e a lista de spans
+    da requisição registrada no log estruturado ao final dela. Fora da thread da
+    requisição, os spans só chegam lá com o `rastreamento` dela (rastreamento_atual).
+    """
+    rastreamento = rastreamento or rastreamento_atual()
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        histograma_etapas.observar(duracao, etapa)
+        if rastreamento is not None:
+            inicio_requisicao, spans = rastreamento
+            spans.append({"etapa": etapa, "inicio_ms": round((inicio - inicio_requisicao) * 1000, 2),
+                          "duracao_ms": round(duracao * 1000, 2)})
+
+
+def _metricas_de_estatisticas(prefixo, estatisticas):
+    """Converte os valores numéricos de um dict de estatisticas() em gauges."""
+    linhas = []
+    for chave, valor in estatisticas.items():
+        nome = f"{prefixo}_{chave}"
+        if isinstance(valor, dict):
+            linhas.extend(_metricas_de_estatisticas(nome, valor))
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            linhas.append(f"# TYPE {nome} gauge")
+            linhas.append(f"{nome} {valor}")
+    return linhas
+
+
+# ===================================================================
+# LEITURA DA PLANILHA
+# ===================================================================
+
+NS_PLANILHA = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+NS_RELS_DOC = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+NS_RELS_PKG = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+CelulaExtract = namedtuple("CelulaExtract", ["value", "number_format"])
+CELULA_VAZIA = CelulaExtract(None, "General")
+
+# Colunas da linha 2 da aba "Extract" usadas nas substituições de texto.
+# As posições vazias correspondem a colunas ignoradas (H a L).
+TEXT_KEYS = [
+    "NOME_CLIENTE", "CONS_ENERGIA_MEDIO", "VOL_PROJ", "OBJ", "PRAZO_CONT",
+    "DESC_1ANO", "MODELO_NEGOCIO", "", "", "", "", "", "TAXA_MEDIA", "PIS",
+    "ICMS", "PONTA", "FORA_PONTA"
+]
+CAMPOS_FORM_RESERVADOS = ["campos", "slides_a_manter", "custom_slides", "slides_conhecidos", "slide", "dpi", "formato", "stream", "tipo", "planilha_token"]
+# Intervalos das tabelas {{FLUXO1}} e {{FLUXO2}} na aba Extract. Intervalos sem linha
+# final ('H2:L') vão até a última linha preenchida daquelas colunas, que então não podem
+# ter mais nada abaixo da tabela (na planilha de lote, as linhas das demais propostas)
+INTERVALO_TABELA1 = os.environ.get("INTERVALO_TABELA1", "H2:L17")
+INTERVALO_TABELA2 = os.environ.get("INTERVALO_TABELA2", "R2:V17")
+# Linhas (cabeçalho incluído) de uma tabela por slide; o excedente continua em slides
+# inseridos logo depois, com o cabeçalho repetido
+TABELA_LINHAS_POR_SLIDE = 16
+# Placeholder de gráfico no modelo -> nome do gráfico na planilha
+GRAFICOS_INFO = {
+    "{{grafico_receita}}": "ReceitaAnual",
+    "{{grafico_custos}}": "Custo"
+}
+
+
+# 'H2:L': intervalo sem linha final
+RE_INTERVALO_ABERTO = re.compile(r"^([A-Z]+\d+):([A-Z]+)$")
+
+
+class PlanilhaExtract:
+    """
+    Valores em cache e formatos numéricos de uma aba, lidos numa única passada.
+    Imutável: linhas e intervalos são devolvidos como tuplas de CelulaExtract.
+    """
+    __slots__ = ("_celulas", "max_row", "max_column")
+
+    def __init__(self, celulas, max_row, max_column):
+        self._celulas = celulas
+        self.max_row = max_row
+        self.max_column = max_column
+
+    def __len__(self):
+        """Quantidade de células com valor ou formato lidas."""
+        return len(self._celulas)
+
+    def celula(self, row, column):
+        return self._celulas.get((row, column), CELULA_VAZIA)
+
+    def linha(self, row):
+        # Mesmo comportamento de ws[row] no openpyxl: da coluna A até a última coluna usada
+        return tuple(self.celula(row, col) for col in range(1, self.max_column + 1))
+
+    def intervalo(self, range_string):
+        aberto = RE_INTERVALO_ABERTO.match(range_string)
+        if aberto:
+            min_col, min_row, max_col, _ = range_boundaries(f"{aberto.group(1)}:{aberto.group(2)}1")
+            max_row = max(
+                (row for (row, col), celula in self._celulas.items()
+                 if min_col <= col <= max_col and celula.value is not None),
+                default=min_row - 1,
+            )
+        else:
+            min_col, min_row, max_col, max_row = range_boundaries(range_string)
+        return tuple(
+            tuple(self.celula(row, col) for col in range(min_col, max_col + 1))
+            for row in range(min_row, max_row + 1)
+        )
+
+
+def _caminho_relacionado(origem, alvo):
+    if alvo.startswith("/"):
+        return alvo.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(origem), alvo))
+
+
+def _ler_relacionamentos(zf, parte):
+    caminho_rels = posixpath.join(posixpath.dirname(parte), "_rels", posixpath.basename(parte) + ".rels")
+    if caminho_rels not in zf.namelist():
+        return {}
+    rels = {}
+    with zf.open(caminho_rels) as fonte:
+        for _, elem in iterparse(fonte):
+            if elem.tag == f"{NS_RELS_PKG}Relationship":
+                rels[elem.get("Id")] = (elem.get("Type"), _caminho_relacionado(parte, elem.get("Target")))
+    return rels
+
+
+def _ler_formatos(zf, caminho_estilos):
+    """Mapeia o índice de estilo da célula (atributo s) para o código do formato numérico."""
+    if not caminho_estilos or caminho_estilos not in zf.namelist():
+        return ["General"]
+    formatos_custom = {}
+    ids_por_estilo = []
+    dentro_cell_xfs = False
+    with zf.open(caminho_estilos) as fonte:
+        for evento, elem in iterparse(fonte, events=("start", "end")):
+            if elem.tag == f"{NS_PLANILHA}cellXfs":
+                dentro_cell_xfs = evento == "start"
+            elif evento == "end" and elem.tag == f"{NS_PLANILHA}numFmt":
+                formatos_custom[int(elem.get("numFmtId"))] = elem.get("formatCode")
+            elif evento == "end" and dentro_cell_xfs and elem.tag == f"{NS_PLANILHA}xf":
+                ids_por_estilo.append(int(elem.get("numFmtId", 0)))
+    return [formatos_custom.get(fmt_id) or BUILTIN_FORMATS.get(fmt_id, "General") for fmt_id in ids_por_estilo] or ["General"]
+
+
+def _converter_numero(valor):
+    if "." in valor or "E" in valor or "e" in valor:
+        return float(valor)
+    return int(valor)
+
+
+def _listar_abas(zf):
+    """Devolve ({nome da aba: caminho}, relacionamentos do workbook, época das datas)."""
+    rels = _ler_relacionamentos(zf, "xl/workbook.xml")
+    abas = {}
+    epoca = WINDOWS_EPOCH
+    with zf.open("xl/workbook.xml") as fonte:
+        for _, elem in iterparse(fonte):
+            if elem.tag == f"{NS_PLANILHA}workbookPr" and elem.get("date1904") in ("1", "true"):
+                epoca = MAC_EPOCH
+            elif elem.tag == f"{NS_PLANILHA}sheet" and elem.get(f"{NS_RELS_DOC}id") in rels:
+                abas[elem.get("name")] = rels[elem.get(f"{NS_RELS_DOC}id")][1]
+    return abas, rels, epoca
+
+
+class _LeitorBuffer(io.RawIOBase):
+    """Arquivo somente leitura, com posição própria, sobre um buffer (mmap, memoryview) sem copiá-lo."""
+
+    def __init__(self, buffer):
+        self._buffer = memoryview(buffer)
+        self._posicao = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, tamanho=-1):
+        fim = len(self._buffer) if tamanho is None or tamanho < 0 else self._posicao + tamanho
+        dados = bytes(self._buffer[self._posicao:fim])
+        self._posicao += len(dados)
+        return dados
+
+    def readinto(self, destino):
+        dados = self.read(len(destino))
+        destino[:len(dados)] = dados
+        return len(dados)
+
+    def seek(self, deslocamento, de_onde=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._posicao, io.SEEK_END: len(self._buffer)}[de_onde]
+        if base + deslocamento < 0:
+            raise ValueError("Posição negativa.")
+        self._posicao = base + deslocamento
+        return self._posicao
+
+    def tell(self):
+        return self._posicao
+
+    def close(self):
+        self._buffer.release()
+        super().close()
+
+
+def _abrir_xlsx(origem):
+    """`origem` pode ser o conteúdo do arquivo (bytes, memoryview, mmap) ou um arquivo aberto."""
+    if isinstance(origem, (bytes, bytearray)):
+        origem = BytesIO(origem)
+    elif isinstance(origem, (memoryview, mmap.mmap)):
+        origem = _LeitorBuffer(origem)
+    return zipfile.ZipFile(origem)
+
+
+def carregar_planilha_extract(origem, nome_aba="Extract"):
+    """
+    Lê valores em cache e formatos numéricos de uma aba do xlsx numa única passada
+    (equivalente a combinar load_workbook com data_only=True e data_only=False).
+    """
+    with _abrir_xlsx(origem) as zf:
+        return _ler_aba(zf, nome_aba)
+
+
+def _ler_aba(zf, nome_aba):
+    abas, rels, epoca = _listar_abas(zf)
+    if nome_aba not in abas:
+        raise KeyError(f"Worksheet {nome_aba} does not exist.")
+    caminho_aba = abas[nome_aba]
+    caminhos_por_tipo = {tipo.rsplit("/", 1)[-1]: alvo for tipo, alvo in rels.values()}
+
+    shared_strings = []
+    if caminhos_por_tipo.get("sharedStrings") in zf.namelist():
+        with zf.open(caminhos_por_tipo["sharedStrings"]) as fonte:
+            shared_strings = read_string_table(fonte)
+
+    formatos = _ler_formatos(zf, caminhos_por_tipo.get("styles"))
+    estilos_data = {i for i, fmt in enumerate(formatos) if is_date_format(fmt)}
+    estilos_duracao = {i for i, fmt in enumerate(formatos) if is_timedelta_format(fmt)}
+
+    celulas = {}
+    max_row = max_column = 0
+    row = col = 0
+    with zf.open(caminho_aba) as fonte:
+        for evento, elem in iterparse(fonte, events=("start", "end")):
+            tag = elem.tag
+            if evento == "start":
+                if tag == f"{NS_PLANILHA}row":
+                    row = int(elem.get("r", row + 1))
+                    col = 0
+                continue
+            if tag == f"{NS_PLANILHA}c":
+                coordenada = elem.get("r")
+                if coordenada:
+                    row, col = coordinate_to_tuple(coordenada)
+                else:
+                    col += 1
+                estilo = int(elem.get("s", 0))
+                tipo = elem.get("t", "n")
+                valor = elem.findtext(f"{NS_PLANILHA}v") or None
+                if tipo == "inlineStr":
+                    valor = "".join(t.text or "" for t in elem.iter(f"{NS_PLANILHA}t")) or None
+                elif valor is not None:
+                    if tipo == "n":
+                        valor = _converter_numero(valor)
+                        if estilo in estilos_data:
+                            try:
+                                valor = from_excel(valor, epoca, timedelta=estilo in estilos_duracao)
+                            except (OverflowError, ValueError):
+                                valor = "#VALUE!"
+                    elif tipo == "s":
+                        valor = shared_strings[int(valor)]
+                    elif tipo == "b":
+                        valor = bool(int(valor))
+                    elif tipo == "d":
+                        valor = from_ISO8601(valor)
+                formato = formatos[estilo] if estilo < len(formatos) else "General"
+                celulas[(row, col)] = CelulaExtract(valor, formato)
+                max_row = max(max_row, row)
+                max_column = max(max_column, col)
+                elem.clear()
+            elif tag == f"{NS_PLANILHA}row":
+                elem.clear()
+            elif tag == f"{NS_PLANILHA}sheetData":
+                break
+
+    return PlanilhaExtract(celulas, max_row, max_column)
+
+
+def montar_substituicoes(planilha, form_data, linha=2):
+    """Monta o dicionário {{CHAVE}} -> valor a partir de uma linha da planilha e do formulário."""
+    row_values = [cell.value for cell in planilha.linha(linha)]
+    text_subs = {
+        f"{{{{{key}}}}}": (str(row_values[idx]) if idx < len(row_values) and row_values[idx] is not None else "")
+        for idx, key in enumerate(TEXT_KEYS) if key
+    }
+    for key, value in form_data.items():
+        if key not in CAMPOS_FORM_RESERVADOS:
+            text_subs[f"{{{{{key}}}}}"] = value
+    return text_subs
+
+# ===================================================================
+# ÍNDICE DE PLACEHOLDERS
+# ===================================================================
+
+PADRAO_PLACEHOLDER = re.compile(r"\{\{[^{}]*\}\}")
+
+# Posição de um placeholder: slide, shape, parágrafo e runs [run_inicio, run_fim] que o contêm
+LocalPlaceholder = namedtuple("LocalPlaceholder", ["slide_id", "shape_id", "paragrafo", "run_inicio", "run_fim"])
+
+
+class IndicePlaceholders:
+    """
+    Mapa placeholder -> posições no deck, montado numa única varredura dos slides.
+    É calculado uma vez por versão do modelo (ver CacheTemplate) e copiado por
+    requisição, para que cada etapa de substituição visite apenas os shapes localizados.
+    """
+
+    def __init__(self, locais=None):
+        self._locais = {token: list(posicoes) for token, posicoes in (locais or {}).items()}
+
+    @classmethod
+    def construir(cls, prs):
+        indice = cls()
+        for slide in prs.slides:
+            indice.indexar_slide(slide)
+        return indice
+
+    def indexar_slide(self, slide):
+        for shape in slide.shapes:
+            if not shape.has_text_frame:
+                continue
+            for p_idx, paragraph in enumerate(shape.text_frame.paragraphs):
+                textos = [run.text for run in paragraph.runs]
+                full_text = ''.join(textos)
+                if "{{" not in full_text:
+                    continue
+                # Posição inicial de cada run no texto do parágrafo
+                inicios = []
+                pos = 0
+                for texto in textos:
+                    inicios.append(pos)
+                    pos += len(texto)
+                for match in PADRAO_PLACEHOLDER.finditer(full_text):
+                    run_inicio = bisect.bisect_right(inicios, match.start()) - 1
+                    run_fim = bisect.bisect_right(inicios, match.end() - 1) - 1
+                    local = LocalPlaceholder(slide.slide_id, shape.shape_id, p_idx, run_inicio, run_fim)
+                    self._locais.setdefault(match.group(0), []).append(local)
+
+    def copiar(self, slide_ids=None):
+        """Cópia do índice; com `slide_ids`, só as posições desses slides."""
+        if slide_ids is None:
+            return IndicePlaceholders(self._locais)
+        locais = {}
+        for token, posicoes in self._locais.items():
+            filtradas = [local for local in posicoes if local.slide_id in slide_ids]
+            if filtradas:
+                locais[token] = filtradas
+        return IndicePlaceholders(locais)
+
+    def tokens(self):
+        return list(self._locais)
+
+    def locais(self, token, ignorar_caixa=False):
+        if not ignorar_caixa:
+            return list(self._locais.get(token, []))
+        token = token.lower()
+        return [local for chave, posicoes in self._locais.items() if chave.lower() == token for local in posicoes]
+
+    def _agrupar_por_shape(self, prs, locais):
+        """Agrupa as posições por shape e resolve (slide, shape) no deck atual."""
+        grupos = {}
+        for local in locais:
+            grupos.setdefault((local.slide_id, local.shape_id), []).append(local)
+        slides = {}
+        for (slide_id, shape_id), posicoes in grupos.items():
+            if slide_id not in slides:
+                slide = prs.slides.get(slide_id)
+                slides[slide_id] = (slide, {s.shape_id: s for s in slide.shapes} if slide is not None else {})
+            slide, shapes_por_id = slides[slide_id]
+            shape = shapes_por_id.get(shape_id)
+            if shape is not None:
+                yield slide, shape, posicoes
+
+    def shapes(self, prs, token, ignorar_caixa=False):
+        """Devolve (slide, shape) de cada shape que contém o token, sem repetir shapes."""
+        return [(slide, shape) for slide, shape, _ in self._agrupar_por_shape(prs, self.locais(token, ignorar_caixa))]
+
+    def paragrafos(self, prs, tokens):
+        """Devolve os parágrafos (sem repetição) que contêm algum dos tokens."""
+        locais = [local for token in tokens for local in self._locais.get(token, [])]
+        encontrados = []
+        for _, shape, posicoes in self._agrupar_por_shape(prs, locais):
+            paragraphs = shape.text_frame.paragraphs
+            for p_idx in sorted({local.paragrafo for local in posicoes}):
+                if p_idx < len(paragraphs):
+                    encontrados.append(paragraphs[p_idx])
+        return encontrados
+
+# ===================================================================
+# CACHE DO MODELO
+# ===================================================================
+
+def _clonar_pacote(pacote, slides_descartados=()):
+    """
+    Copia o pacote parte a parte: o XML de cada parte é duplicado com deepcopy e os
+    blobs binários (imagens, mídias) são compartilhados, já que são imutáveis.
+    Os caches lazyproperty do python-pptx não são copiados, pois podem apontar para
+    elementos do pacote original.
+
+    Os slides cujos rIds (na parte da apresentação) estão em `slides_descartados`
+    ficam fora da cópia, junto com as partes alcançáveis só a partir deles (notas,
+    imagens, gráficos), que nem chegam a ser duplicadas.
+    """
+    apresentacao = pacote.presentation_part
+
+    def relacionamentos(origem):
+        for rId, rel in origem._rels.items():
+            if origem is not apresentacao or rId not in slides_descartados:
+                yield rId, rel
+
+    novo_pacote = type(pacote)(pacote._pkg_file)
+    novas_partes = {}
+    pendentes = [pacote]
+    while pendentes:
+        for _, rel in relacionamentos(pendentes.pop()):
+            if rel.is_external or rel.target_part in novas_partes:
+                continue
+            parte = rel.target_part
+            nova = type(parte).__new__(type(parte))
+            nova.__dict__.update({
+                chave: valor for chave, valor in vars(parte).items()
+                if not isinstance(getattr(type(parte), chave, None), lazyproperty)
+            })
+            nova._package = novo_pacote
+            if "_element" in vars(parte):
+                nova._element = copy.deepcopy(parte._element)
+            novas_partes[parte] = nova
+            pendentes.append(parte)
+
+    def copiar_relacionamentos(origem, destino):
+        for rId, rel in relacionamentos(origem):
+            alvo = rel.target_ref if rel.is_external else novas_partes[rel.target_part]
+            destino._rels._rels[rId] = _Relationship(rel._base_uri, rId, rel.reltype, rel._target_mode, alvo)
+
+    copiar_relacionamentos(pacote, novo_pacote)
+    for parte, nova in novas_partes.items():
+        copiar_relacionamentos(parte, nova)
+    if slides_descartados:
+        lista = novas_partes[apresentacao]._element.sldIdLst
+        for sld_id in list(lista):
+            if sld_id.rId in slides_descartados:
+                lista.remove(sld_id)
+    return novo_pacote
+
+
+UltimoSlideModelo = namedtuple("UltimoSlideModelo", ["slide_id", "layout"])
+
+
+class CacheTemplate:
+    """
+    Mantém o modelo .pptx já interpretado em memória, junto com seu índice de
+    placeholders, e entrega uma cópia independente (ver _clonar_pacote) para cada requisição.
+    O arquivo é relido quando mtime/tamanho mudam; se o conteúdo (sha1) for o mesmo,
+    a versão em memória é mantida.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.versao = None
+        self.hits = 0
+        self.misses = 0
+        self._prs = None
+        self._indice = None
+        self._assinatura = None
+        self._conteudo = None
+        self._lock = threading.Lock()
+        # Último slide do modelo completo: os slides customizados entram antes dele e com o layout dele
+        self.ultimo_slide = None
+        # Resultado da verificação de _clonar_pacote com o python-pptx instalado (ver _verificar_clonagem)
+        self.clonagem_ok = None
+
+    def _assinatura_atual(self):
+        st = os.stat(self.caminho)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _recarregar(self, assinatura):
+        with open(self.caminho, "rb") as f:
+            conteudo = f.read()
+        versao = hashlib.sha1(conteudo).hexdigest()
+        if self._prs is None or versao != self.versao:
+            self._prs = Presentation(BytesIO(conteudo))
+            self._indice = IndicePlaceholders.construir(self._prs)
+            ultimo = self._prs.slides[-1] if len(self._prs.slides) else None
+            self.ultimo_slide = ultimo and UltimoSlideModelo(ultimo.slide_id, ultimo.slide_layout.part.partname)
+            self._conteudo = conteudo
+            self.clonagem_ok = self._verificar_clonagem()
+            self.versao = versao
+            self.misses += 1
+        else:
+            self.hits += 1
+        self._assinatura = assinatura
+
+    def _verificar_clonagem(self):
+        """
+        _clonar_pacote mexe em detalhes internos do python-pptx (a versão suportada está
+        fixada no requirements.txt). Clona o modelo inteiro e sem o primeiro slide, salva,
+        reabre e compara slides e shapes; se algo não bater, as cópias passam a ser
+        feitas relendo o arquivo (mais lento, mas sem depender desses detalhes).
+        """
+        esperado = [len(slide.shapes) for slide in self._prs.slides]
+        sld_ids = list(self._prs.slides._sldIdLst)
+        casos = [(set(), esperado)]
+        if len(sld_ids) > 1:
+            casos.append(({sld_ids[0].rId}, esperado[1:]))
+        try:
+            for descartados, shapes_esperados in casos:
+                buffer = BytesIO()
+                _clonar_pacote(self._prs.part.package, descartados).presentation_part.presentation.save(buffer)
+                reaberta = Presentation(BytesIO(buffer.getvalue()))
+                shapes = [len(slide.shapes) for slide in reaberta.slides]
+                if shapes != shapes_esperados:
+                    raise ValueError(f"{len(shapes)} slides na cópia, {len(shapes_esperados)} esperados")
+        except Exception as e:
+            print(f"AVISO: cópia rápida do modelo desativada com o python-pptx {pptx.__version__} ({e}); "
+                  f"o modelo será relido a cada requisição")
+            return False
+        return True
+
+    def _abrir_do_arquivo(self, conteudo, indice, slides_a_manter):
+        """Cópia sem _clonar_pacote: interpreta de novo o arquivo e remove os slides não mantidos."""
+        prs = Presentation(BytesIO(conteudo))
+        if not slides_a_manter:
+            return prs, indice.copiar()
+        manter = {numero - 1 for numero in slides_a_manter}
+        ids_mantidos = set()
+        for posicao in range(len(prs.slides) - 1, -1, -1):
+            sld_id = prs.slides._sldIdLst[posicao]
+            if posicao in manter:
+                ids_mantidos.add(sld_id.id)
+            else:
+                prs.part.drop_rel(sld_id.rId)
+                del prs.slides._sldIdLst[posicao]
+        return prs, indice.copiar(ids_mantidos)
+
+    def versao_atual(self):
+        """Versão (sha1) do modelo em disco neste momento, recarregando-o se tiver mudado."""
+        assinatura = self._assinatura_atual()
+        with self._lock:
+            if self._prs is None or assinatura != self._assinatura:
+                self._recarregar(assinatura)
+            return self.versao
+
+    def obter(self, slides_a_manter=None):
+        """
+        Devolve (Presentation, IndicePlaceholders) novos, que podem ser alterados livremente.
+        Com `slides_a_manter` (números dos slides do modelo, a partir de 1), a cópia já
+        vem só com esses slides.
+        """
+        assinatura = self._assinatura_atual()
+        with self._lock:
+            if self._prs is None or assinatura != self._assinatura:
+                self._recarregar(assinatura)
+            else:
+                self.hits += 1
+            if self.clonagem_ok:
+                return self._clonar(slides_a_manter)
+            conteudo, indice = self._conteudo, self._indice
+        # Sem a cópia rápida, o arquivo é interpretado fora do lock
+        return self._abrir_do_arquivo(conteudo, indice, slides_a_manter)
+
+    def _clonar(self, slides_a_manter):
+        if not slides_a_manter:
+            pacote = _clonar_pacote(self._prs.part.package)
+            return pacote.presentation_part.presentation, self._indice.copiar()
+        manter = {numero - 1 for numero in slides_a_manter}
+        descartados, ids_mantidos = set(), set()
+        for posicao, sld_id in enumerate(self._prs.slides._sldIdLst):
+            if posicao in manter:
+                ids_mantidos.add(sld_id.id)
+            else:
+                descartados.add(sld_id.rId)
+        pacote = _clonar_pacote(self._prs.part.package, descartados)
+        return pacote.presentation_part.presentation, self._indice.copiar(ids_mantidos)
+
+    def estatisticas(self):
+        return {"hits": self.hits, "misses": self.misses, "versao": self.versao, "clonagem_ok": self.clonagem_ok}
+
+
+template_cache = CacheTemplate(MODELO_PATH)
+
+# ===================================================================
+# GRÁFICOS NATIVOS
+# ===================================================================
+
+NS_CHART = "{http://schemas.openxmlformats.org/drawingml/2006/chart}"
+NS_DESENHO_XLSX = "{http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing}"
+NS_DRAWINGML = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+
+SerieGrafico = namedtuple("SerieGrafico", ["nome", "valores", "formato_numero"])
+DefinicaoGrafico = namedtuple("DefinicaoGrafico", ["nome", "tipo", "titulo", "categorias", "series"])
+
+# (elemento do plotArea, barDir, grouping) -> tipo de gráfico do python-pptx
+TIPOS_GRAFICO = {
+    ("barChart", "col", "clustered"): XL_CHART_TYPE.COLUMN_CLUSTERED,
+    ("barChart", "col", "stacked"): XL_CHART_TYPE.COLUMN_STACKED,
+    ("barChart", "col", "percentStacked"): XL_CHART_TYPE.COLUMN_STACKED_100,
+    ("barChart", "bar", "clustered"): XL_CHART_TYPE.BAR_CLUSTERED,
+    ("barChart", "bar", "stacked"): XL_CHART_TYPE.BAR_STACKED,
+    ("barChart", "bar", "percentStacked"): XL_CHART_TYPE.BAR_STACKED_100,
+    ("lineChart", None, "standard"): XL_CHART_TYPE.LINE_MARKERS,
+    ("lineChart", None, "stacked"): XL_CHART_TYPE.LINE_MARKERS_STACKED,
+    ("lineChart", None, "percentStacked"): XL_CHART_TYPE.LINE_MARKERS_STACKED_100,
+    ("areaChart", None, "standard"): XL_CHART_TYPE.AREA,
+    ("areaChart", None, "stacked"): XL_CHART_TYPE.AREA_STACKED,
+    ("areaChart", None, "percentStacked"): XL_CHART_TYPE.AREA_STACKED_100,
+    ("pieChart", None, None): XL_CHART_TYPE.PIE,
+    ("doughnutChart", None, None): XL_CHART_TYPE.DOUGHNUT,
+}
+# Variações 3D são desenhadas com o tipo 2D equivalente
+ELEMENTOS_GRAFICO = {
+    "barChart": "barChart", "bar3DChart": "barChart", "lineChart": "lineChart", "line3DChart": "lineChart",
+    "areaChart": "areaChart", "area3DChart": "areaChart", "pieChart": "pieChart", "pie3DChart": "pieChart",
+    "doughnutChart": "doughnutChart",
+}
+
+
+def _valores_cache(ref):
+    """Lê os pontos de strCache/numCache de uma referência (c:cat, c:val, c:tx)."""
+    cache = ref.find(f".//{NS_CHART}numCache")
+    if cache is None:
+        cache = ref.find(f".//{NS_CHART}strCache")
+    if cache is None:
+        return None, None
+    pt_count = cache.find(f"{NS_CHART}ptCount")
+    total = int(pt_count.get("val", 0)) if pt_count is not None else 0
+    pontos = {int(pt.get("idx")): pt.findtext(f"{NS_CHART}v") for pt in cache.iter(f"{NS_CHART}pt")}
+    total = max(total, max(pontos, default=-1) + 1)
+    return [pontos.get(i) for i in range(total)], cache.findtext(f"{NS_CHART}formatCode")
+
+
+def _valores_formula(ref, zf, abas_lidas):
+    """Quando não há cache no gráfico, lê o intervalo referenciado direto da aba."""
+    formula = ref.findtext(f".//{NS_CHART}f")
+    if not formula:
+        return [], None
+    nome_aba, (min_col, min_row, max_col, max_row) = range_to_tuple(formula.lstrip("=").replace("$", ""))
+    if nome_aba not in abas_lidas:
+        abas_lidas[nome_aba] = _ler_aba(zf, nome_aba)
+    aba = abas_lidas[nome_aba]
+    celulas = [aba.celula(row, col) for row in range(min_row, max_row + 1) for col in range(min_col, max_col + 1)]
+    formato = celulas[0].number_format if celulas else None
+    return [celula.value for celula in celulas], formato
+
+
+def _ler_referencia(ref, zf, abas_lidas, numerica):
+    if ref is None:
+        return [], None
+    valores, formato = _valores_cache(ref)
+    if valores is None:
+        valores, formato = _valores_formula(ref, zf, abas_lidas)
+    elif numerica:
+        valores = [float(v) if v not in (None, "") else None for v in valores]
+    if numerica:
+        valores = [v if isinstance(v, (int, float)) and not isinstance(v, bool) else None for v in valores]
+    return valores, formato
+
+
+def _rotulo_categoria(valor, data, epoca):
+    if valor is None or valor == "":
+        return ""
+    if isinstance(valor, datetime.date):
+        return valor
+    if data:
+        return from_excel(float(valor), epoca)
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def _ler_definicao_grafico(zf, caminho, nome, abas_lidas, epoca):
+    with zf.open(caminho) as fonte:
+        raiz = ElementTree.parse(fonte).getroot()
+    plot_area = raiz.find(f"{NS_CHART}chart/{NS_CHART}plotArea")
+    elemento = next((e for e in plot_area if e.tag[len(NS_CHART):] in ELEMENTOS_GRAFICO), None) if plot_area is not None else None
+    if elemento is None:
+        return None
+
+    tipo_base = ELEMENTOS_GRAFICO[elemento.tag[len(NS_CHART):]]
+    bar_dir = elemento.find(f"{NS_CHART}barDir")
+    grouping = elemento.find(f"{NS_CHART}grouping")
+    chave_tipo = (
+        tipo_base,
+        (bar_dir.get("val", "col") if bar_dir is not None else "col") if tipo_base == "barChart" else None,
+        (grouping.get("val", "standard") if grouping is not None else "standard") if tipo_base not in ("pieChart", "doughnutChart") else None,
+    )
+    tipo = TIPOS_GRAFICO.get(chave_tipo, XL_CHART_TYPE.COLUMN_CLUSTERED)
+    simbolos = [ser.find(f"{NS_CHART}marker/{NS_CHART}symbol") for ser in elemento.findall(f"{NS_CHART}ser")]
+    if tipo_base == "lineChart" and simbolos and all(s is not None and s.get("val") == "none" for s in simbolos):
+        # Linhas sem marcadores em todas as séries
+        tipo = {
+            XL_CHART_TYPE.LINE_MARKERS: XL_CHART_TYPE.LINE,
+            XL_CHART_TYPE.LINE_MARKERS_STACKED: XL_CHART_TYPE.LINE_STACKED,
+            XL_CHART_TYPE.LINE_MARKERS_STACKED_100: XL_CHART_TYPE.LINE_STACKED_100,
+        }[tipo]
+
+    categorias = []
+    series = []
+    for ser in elemento.findall(f"{NS_CHART}ser"):
+        valores, formato = _ler_referencia(ser.find(f"{NS_CHART}val"), zf, abas_lidas, numerica=True)
+        cats, formato_cats = _ler_referencia(ser.find(f"{NS_CHART}cat"), zf, abas_lidas, numerica=False)
+        if len(cats) > len(categorias):
+            data = bool(formato_cats) and is_date_format(formato_cats)
+            categorias = [_rotulo_categoria(c, data, epoca) for c in cats]
+        tx = ser.find(f"{NS_CHART}tx")
+        nome_serie = None
+        if tx is not None:
+            nome_serie = tx.findtext(f"{NS_CHART}v")
+            if nome_serie is None:
+                textos, _ = _ler_referencia(tx, zf, abas_lidas, numerica=False)
+                nome_serie = str(textos[0]) if textos and textos[0] is not None else None
+        series.append(SerieGrafico(nome_serie or f"Série {len(series) + 1}", valores,
+                                   formato if formato and formato != "General" else None))
+
+    titulo = None
+    elem_titulo = raiz.find(f"{NS_CHART}chart/{NS_CHART}title")
+    if elem_titulo is not None:
+        titulo = "".join(t.text or "" for t in elem_titulo.iter(f"{NS_DRAWINGML}t")) or None
+    return DefinicaoGrafico(nome, tipo, titulo, categorias, series)
+
+
+def carregar_graficos(origem, nomes=None):
+    """
+    Lê do xlsx as definições dos gráficos das abas (tipo, título, categorias e séries,
+    usando os valores em cache salvos pelo Excel) sem depender do Office.
+    Devolve {nome do gráfico: DefinicaoGrafico}; `nomes` restringe os gráficos lidos.
+    """
+    graficos = {}
+    with _abrir_xlsx(origem) as zf:
+        abas, _, epoca = _listar_abas(zf)
+        abas_lidas = {}
+        for caminho_aba in abas.values():
+            for tipo_rel, caminho_desenho in _ler_relacionamentos(zf, caminho_aba).values():
+                if not tipo_rel.endswith("/drawing") or caminho_desenho not in zf.namelist():
+                    continue
+                rels_desenho = _ler_relacionamentos(zf, caminho_desenho)
+                with zf.open(caminho_desenho) as fonte:
+                    desenho = ElementTree.parse(fonte).getroot()
+                for frame in desenho.iter(f"{NS_DESENHO_XLSX}graphicFrame"):
+                    c_nv_pr = frame.find(f".//{NS_DESENHO_XLSX}cNvPr")
+                    ref_grafico = frame.find(f".//{NS_CHART}chart")
+                    if c_nv_pr is None or ref_grafico is None:
+                        continue
+                    nome = c_nv_pr.get("name")
+                    rel = rels_desenho.get(ref_grafico.get(f"{NS_RELS_DOC}id"))
+                    if (nomes is not None and nome not in nomes) or nome in graficos or rel is None:
+                        continue
+                    definicao = _ler_definicao_grafico(zf, rel[1], nome, abas_lidas, epoca)
+                    if definicao is not None:
+                        graficos[nome] = definicao
+    return graficos
+
+
+def inserir_grafico(slide, definicao, left, top, width, height):
+    """Desenha a definição como gráfico nativo do PPTX na posição indicada."""
+    chart_data = CategoryChartData()
+    chart_data.categories = definicao.categorias
+    for serie in definicao.series:
+        chart_data.add_series(serie.nome, serie.valores, number_format=serie.formato_numero)
+    chart = slide.shapes.add_chart(definicao.tipo, left, top, width, height, chart_data).chart
+    if definicao.titulo:
+        chart.has_title = True
+        chart.chart_title.text_frame.text = definicao.titulo
+    if len(definicao.series) > 1 or definicao.tipo in (XL_CHART_TYPE.PIE, XL_CHART_TYPE.DOUGHNUT):
+        chart.has_legend = True
+        chart.legend.position = XL_LEGEND_POSITION.BOTTOM
+        chart.legend.include_in_layout = False
+    return chart
+
+# ===================================================================
+# FUNÇÕES DE APOIO
+# ===================================================================
+
+# Formatação pt-BR sem locale: setlocale é global ao processo e não é seguro entre
+# threads, e o resultado dependia da máquina ter pt_BR.UTF-8 instalado.
+_TROCA_SEPARADORES = str.maketrans({",": ".", ".": ","})
+
+
+def _decimal_ptbr(valor):
+    """1234.5 -> '1.234,50'."""
+    return f"{valor:,.2f}".translate(_TROCA_SEPARADORES)
+
+
+def _formatar_percentual(valor):
+    if valor is None:
+        return ""
+    try:
+        return f"{float(valor):.2%}".replace('.', ',')
+    except (ValueError, TypeError):
+        return str(valor)
+
+
+def _formatar_moeda(valor):
+    """Mesmo resultado de locale.currency(valor, grouping=True) em pt_BR: 'R$ 1.234,56' / '-R$ 1.234,56'."""
+    if valor is None:
+        return ""
+    try:
+        numero = float(valor)
+    except (ValueError, TypeError):
+        return str(valor)
+    return ("-R$ " if numero < 0 else "R$ ") + _decimal_ptbr(abs(numero))
+
+
+def _formatar_numero(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, (float, int)):
+        return _decimal_ptbr(valor)
+    return str(valor)
+
+
+@functools.lru_cache(maxsize=None)
+def formatador(number_format):
+    """Função de formatação de um number_format do Excel, decidida uma vez por formato distinto."""
+    formato = str(number_format)
+    if '%' in formato:
+        return _formatar_percentual
+    if 'R$' in formato or 'BRL' in formato:
+        return _formatar_moeda
+    return _formatar_numero
+
+
+def format_cell(cell):
+    return formatador(cell.number_format)(cell.value)
+
+
+def formatar_celulas(celulas):
+    """Formata uma linha, coluna ou intervalo de células de uma vez."""
+    return [formatador(celula.number_format)(celula.value) for celula in celulas]
+
+def build_table_data(planilha, range_string):
+    return [formatar_celulas(row) for row in planilha.intervalo(range_string)]
+
+
+class MotorSubstituicao:
+    """
+    Substituição de texto compilada uma vez por requisição: uma única regex com todas
+    as chaves (ativas -> valor, inativas -> vazio), aplicada em uma passada por parágrafo.
+    O texto substituído fica no run onde o placeholder começa, preservando a formatação
+    de cada run.
+    """
+
+    def __init__(self, substituicoes, campos_ativos):
+        campos_ativos = set(campos_ativos)
+        self.mapa = {
+            chave: (str(valor) if valor is not None else "") if chave.strip('{} ') in campos_ativos else ""
+            for chave, valor in substituicoes.items()
+        }
+        # Chaves mais longas primeiro, para que uma chave nunca "roube" o início de outra
+        chaves = sorted(self.mapa, key=len, reverse=True)
+        self.padrao = re.compile("|".join(map(re.escape, chaves))) if chaves else None
+
+    def aplicar(self, paragraph):
+        """Substitui as chaves do parágrafo; devolve True se algo mudou."""
+        if self.padrao is None:
+            return False
+        runs = paragraph.runs
+        textos = [run.text for run in runs]
+        full_text = ''.join(textos)
+        matches = list(self.padrao.finditer(full_text))
+        if not matches:
+            return False
+
+        inicios = []
+        pos = 0
+        for texto in textos:
+            inicios.append(pos)
+            pos += len(texto)
+        pedacos = [[] for _ in runs]
+
+        def copiar_trecho(inicio, fim):
+            # Distribui o texto original [inicio, fim) entre os runs a que ele pertence
+            idx = bisect.bisect_right(inicios, inicio) - 1
+            while inicio < fim:
+                fim_run = inicios[idx] + len(textos[idx])
+                corte = min(fim, fim_run)
+                if corte > inicio:
+                    pedacos[idx].append(full_text[inicio:corte])
+                inicio = corte
+                idx += 1
+
+        cursor = 0
+        for match in matches:
+            copiar_trecho(cursor, match.start())
+            pedacos[bisect.bisect_right(inicios, match.start()) - 1].append(self.mapa[match.group(0)])
+            cursor = match.end()
+        copiar_trecho(cursor, len(full_text))
+
+        for idx, (run, texto_original) in enumerate(zip(runs, textos)):
+            novo_texto = ''.join(pedacos[idx])
+            if novo_texto == texto_original:
+                continue
+            if not novo_texto and idx > 0:
+                # Run consumido por um placeholder que começou em outro run
+                run._r.getparent().remove(run._r)
+            else:
+                run.text = novo_texto
+        return True
+
+
+def substituir_textos(prs, substituicoes, campos_ativos, indice):
+    motor = MotorSubstituicao(substituicoes, campos_ativos)
+    for paragraph in indice.paragrafos(prs, substituicoes):
+        motor.aplicar(paragraph)
+
+EMU_POR_POLEGADA = 914400
+
+
+def _imagem_com_alfa(imagem):
+    """Imagem em RGBA se tiver transparência de fato; senão em L ou RGB."""
+    if imagem.mode in ("P", "PA", "LA", "La", "RGBA", "RGBa") or "transparency" in imagem.info:
+        imagem = imagem.convert("RGBA")
+        if imagem.getchannel("A").getextrema() != (255, 255):
+            return imagem
+    if imagem.mode not in ("L", "RGB"):
+        imagem = imagem.convert("RGB")
+    return imagem
+
+
+def preparar_logo(logo_bytes, largura, altura):
+    """
+    Logo pronto para uma caixa de `largura` x `altura` (EMU): reduzido para LOGO_DPI
+    (a imagem é esticada na caixa, então cobre as duas dimensões), com a orientação do
+    EXIF aplicada e sem metadados. Vai em PNG quando tem transparência ou até
+    LOGO_CORES_PNG cores (desenhos, texto) e em JPEG nos demais casos (fotos). Formatos
+    que o PIL não abre, GIFs animados e reconversões que não reduzem o arquivo ficam
+    com os bytes originais. O resultado fica em cache pelo hash do conteúdo e da caixa.
+    """
+    alvo = None
+    if largura and altura:
+        alvo = (max(1, round(largura * LOGO_DPI / EMU_POR_POLEGADA)),
+                max(1, round(altura * LOGO_DPI / EMU_POR_POLEGADA)))
+    chave = hashlib.sha1(logo_bytes).hexdigest() + (f"-{alvo[0]}x{alvo[1]}" if alvo else "")
+    preparado = cache_logos.obter(chave)
+    if preparado is not None:
+        return preparado
+
+    try:
+        imagem = Image.open(BytesIO(logo_bytes))
+        if getattr(imagem, "n_frames", 1) > 1:
+            preparado = logo_bytes
+        else:
+            if alvo:
+                # JPEG: decodifica direto em escala reduzida (o lado pedido cobre a caixa
+                # em qualquer orientação do EXIF)
+                lado = max(alvo)
+                imagem.draft(imagem.mode, (lado, lado))
+            imagem.load()
+            imagem = _imagem_com_alfa(ImageOps.exif_transpose(imagem))
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        print(f"AVISO: logo mantido sem otimização ({e})")
+        preparado = logo_bytes
+
+    if preparado is None:
+        reduzido = False
+        if alvo:
+            fator = max(alvo[0] / imagem.width, alvo[1] / imagem.height)
+            if fator < 1:
+                tamanho = (max(1, math.ceil(imagem.width * fator)), max(1, math.ceil(imagem.height * fator)))
+                imagem = imagem.resize(tamanho, Image.LANCZOS)
+                reduzido = True
+        buffer = BytesIO()
+        if imagem.mode == "RGBA" or imagem.getcolors(LOGO_CORES_PNG) is not None:
+            imagem.save(buffer, format="PNG", optimize=True)
+        else:
+            imagem.save(buffer, format="JPEG", quality=LOGO_QUALIDADE, optimize=True)
+        preparado = buffer.getvalue()
+        if not reduzido and len(preparado) >= len(logo_bytes):
+            preparado = logo_bytes
+
+    cache_logos.guardar(chave, preparado)
+    return preparado
+
+
+def substituir_logo(prs, logo_stream, placeholder, indice):
+    """
+    Troca cada forma com o placeholder pelo logo na mesma posição e tamanho. O logo é
+    preparado uma vez para a maior caixa; como os bytes são os mesmos, o python-pptx
+    guarda uma única parte de imagem (pelo sha1), referenciada por todos os slides.
+    """
+    alvos = [(slide, shape) for slide, shape in indice.shapes(prs, placeholder)
+             if placeholder in shape.text_frame.text]
+    if not alvos:
+        return
+    logo_stream.seek(0)
+    logo = preparar_logo(logo_stream.read(),
+                         max(shape.width or 0 for _, shape in alvos),
+                         max(shape.height or 0 for _, shape in alvos))
+    for slide, shape in alvos:
+        left, top, width, height = shape.left, shape.top, shape.width, shape.height
+        sp = shape._sp
+        sp.getparent().remove(sp)
+        slide.shapes.add_picture(BytesIO(logo), left, top, width, height)
+
+# Trechos de XML de uma célula de cabeçalho e de corpo (mesma formatação que o
+# python-pptx produzia célula a célula: Calibri 15pt preto, cabeçalho em negrito
+# sobre fundo cinza). O texto entra entre a abertura e o fechamento.
+_PPR_TABELA = (
+    '<a:pPr><a:defRPr sz="1500"%s><a:solidFill><a:srgbClr val="000000"/></a:solidFill>'
+    '<a:latin typeface="Calibri"/></a:defRPr></a:pPr>'
+)
+_CELULA_CABECALHO = (
+    '<a:tc><a:txBody><a:bodyPr/><a:lstStyle/><a:p>' + _PPR_TABELA % ' b="1"',
+    '</a:p></a:txBody><a:tcPr><a:solidFill><a:srgbClr val="DCDCDC"/></a:solidFill></a:tcPr></a:tc>',
+)
+_CELULA_CORPO = (
+    '<a:tc><a:txBody><a:bodyPr/><a:lstStyle/><a:p>' + _PPR_TABELA % '',
+    '</a:p></a:txBody><a:tcPr/></a:tc>',
+)
+ESTILO_TABELA_PADRAO = "{5C22544A-7EE6-4342-B048-85BDC9FD1C3A}"
+_CARACTERES_CONTROLE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _xml_texto_celula(texto):
+    """Runs da célula; quebras de linha viram parágrafos, como em cell.text."""
+    partes = []
+    for i, linha in enumerate(str(texto).split("\n")):
+        if i:
+            partes.append("</a:p><a:p>")
+        if linha:
+            linha = _CARACTERES_CONTROLE.sub(lambda m: f"_x{ord(m.group()):04X}_", linha)
+            partes.append(f"<a:r><a:t>{escapar_xml(linha)}</a:t></a:r>")
+    return "".join(partes)
+
+
+def montar_xml_tabela(table_data, width, height, altura_linha=None):
+    """
+    Monta o elemento a:tbl inteiro numa única passada (um parse_xml), em vez de
+    preencher e formatar célula a célula pela API do python-pptx. Larguras e alturas
+    seguem a mesma divisão do add_table; `altura_linha` fixa a altura das linhas.
+    """
+    num_rows, num_cols = len(table_data), len(table_data[0])
+    colwidth = width // num_cols
+    rowheight = altura_linha or height // num_rows
+    partes = [
+        f'<a:tbl {nsdecls("a")}><a:tblPr firstRow="1" bandRow="1">'
+        f'<a:tableStyleId>{ESTILO_TABELA_PADRAO}</a:tableStyleId></a:tblPr><a:tblGrid>'
+    ]
+    for col in range(num_cols):
+        largura = width - (num_cols - 1) * colwidth if col == num_cols - 1 else colwidth
+        partes.append(f'<a:gridCol w="{largura}"/>')
+    partes.append("</a:tblGrid>")
+    for r_idx, row_data in enumerate(table_data):
+        altura = height - (num_rows - 1) * rowheight if r_idx == num_rows - 1 and not altura_linha else rowheight
+        partes.append(f'<a:tr h="{altura}">')
+        abertura, fechamento = _CELULA_CABECALHO if r_idx == 0 else _CELULA_CORPO
+        for cell_data in row_data:
+            partes.append(abertura)
+            partes.append(_xml_texto_celula(cell_data))
+            partes.append(fechamento)
+        partes.append("</a:tr>")
+    partes.append("</a:tbl>")
+    return parse_xml("".join(partes))
+
+
+def inserir_tabela(slide, table_data, left, top, width, height, altura_linha=None):
+    graphic_frame = slide.shapes.add_table(1, len(table_data[0]), left, top, width, height)
+    tbl_vazia = graphic_frame._element.graphic.graphicData.tbl
+    tbl_vazia.getparent().replace(tbl_vazia, montar_xml_tabela(table_data, width, height, altura_linha))
+    return graphic_frame
+
+
+def _slide_continuacao(prs, slide_anterior, titulo):
+    """Slide novo com o layout do original, inserido logo depois de `slide_anterior`."""
+    novo = prs.slides.add_slide(slide_anterior.slide_layout)
+    for placeholder in list(novo.placeholders):
+        if titulo and placeholder == novo.shapes.title:
+            placeholder.text_frame.text = titulo
+            continue
+        placeholder._element.getparent().remove(placeholder._element)
+    lista = prs.slides._sldIdLst
+    sld_id = lista[-1]
+    posicao = next(i for i, item in enumerate(lista) if item.id == slide_anterior.slide_id)
+    lista.remove(sld_id)
+    lista.insert(posicao + 1, sld_id)
+    return novo
+
+
+def substituir_tabela(prs, placeholder, table_data, campos_ativos, indice):
+    localizados = [
+        (slide, shape) for slide, shape in indice.shapes(prs, placeholder, ignorar_caixa=True)
+        if placeholder.lower() in shape.text_frame.text.lower()
+    ]
+    if placeholder.strip('{} ') not in campos_ativos:
+        for _, shape in localizados:
+            sp = shape._sp
+            sp.getparent().remove(sp)
+        return
+
+    # Apenas o primeiro shape de cada slide vira tabela
+    slides_processados = set()
+    for slide, shape_to_replace in localizados:
+        if slide.slide_id in slides_processados:
+            continue
+        slides_processados.add(slide.slide_id)
+        left, top, width, height = shape_to_replace.left, shape_to_replace.top, shape_to_replace.width, shape_to_replace.height
+
+        sp = shape_to_replace._sp
+        sp.getparent().remove(sp)
+
+        num_rows = len(table_data)
+        num_cols = len(table_data[0]) if table_data else 0
+        if num_rows == 0 or num_cols == 0:
+            continue
+
+        if num_rows <= TABELA_LINHAS_POR_SLIDE:
+            inserir_tabela(slide, table_data, left, top, width, height)
+            continue
+
+        # Tabela maior que um slide: cabeçalho repetido em cada página, mesma altura de linha
+        cabecalho, corpo = table_data[0], table_data[1:]
+        por_pagina = TABELA_LINHAS_POR_SLIDE - 1
+        altura_linha = height // TABELA_LINHAS_POR_SLIDE
+        titulo = slide.shapes.title.text_frame.text if slide.shapes.title is not None else None
+        destino = slide
+        for inicio in range(0, len(corpo), por_pagina):
+            pagina = [cabecalho] + corpo[inicio:inicio + por_pagina]
+            if inicio:
+                destino = _slide_continuacao(prs, destino, titulo)
+            inserir_tabela(destino, pagina, left, top, width, altura_linha * len(pagina), altura_linha)
+
+
+def substituir_graficos(prs, arquivo_excel, graficos_info, indice, graficos=None):
+    """
+    Substitui placeholders de gráficos por gráficos nativos do PPTX, montados a partir
+    das definições e dos valores em cache salvos no próprio xlsx (sem Excel/COM).
+    O xlsx só é lido se algum placeholder de gráfico restar no deck.
+    """
+    try:
+        # Percorre apenas os shapes localizados pelo índice; um shape com mais de um
+        # placeholder de gráfico é tratado pelo primeiro deles
+        alvos = []
+        shapes_processados = set()
+        for placeholder, chart_name in graficos_info.items():
+            for slide, shape in indice.shapes(prs, placeholder):
+                chave_shape = (slide.slide_id, shape.shape_id)
+                if chave_shape in shapes_processados or placeholder not in shape.text_frame.text:
+                    continue
+                shapes_processados.add(chave_shape)
+                alvos.append((slide, shape, chart_name))
+        if not alvos:
+            return
+
+        if graficos is None:
+            graficos = carregar_graficos(arquivo_excel, {chart_name for _, _, chart_name in alvos})
+
+        for slide, shape, chart_name in alvos:
+            if chart_name not in graficos:
+                print(f"AVISO: O gráfico '{chart_name}' não foi encontrado no arquivo Excel. Verifique o nome.")
+                continue
+
+            inserir_grafico(slide, graficos[chart_name], shape.left, shape.top, shape.width, shape.height)
+            sp = shape._sp
+            sp.getparent().remove(sp)
+
+    except Exception as e:
+        print(f"ERRO CRÍTICO na função substituir_graficos: {e}")
+        traceback.print_exc()
+
+
+def adicionar_slides_customizados(prs, custom_slides_json, ultimo_slide=None):
+    """
+    Acrescenta os slides customizados (título e conteúdo) com o layout do último slide
+    do modelo completo (`ultimo_slide`, ver CacheTemplate), antes dele, se ele tiver
+    sido mantido, ou no fim do deck. Sem `ultimo_slide`, usa o último slide do deck.
+    """
+    try:
+        custom_slides_data = json.loads(custom_slides_json)
+        if not custom_slides_data:
+            return
+
+        sldIdLst = prs.slides._sldIdLst
+        if ultimo_slide is None and len(prs.slides):
+            ultimo_slide = UltimoSlideModelo(prs.slides[-1].slide_id, prs.slides[-1].slide_layout.part.partname)
+        template_slide_layout = prs.slides[-1].slide_layout if len(prs.slides) else prs.slide_layouts[0]
+        ancora = None
+        if ultimo_slide is not None:
+            for master in prs.slide_masters:
+                for layout in master.slide_layouts:
+                    if layout.part.partname == ultimo_slide.layout:
+                        template_slide_layout = layout
+            # Localizado antes de adicionar: os slides novos podem reaproveitar o id de um removido
+            ancora = next((sld for sld in sldIdLst if sld.id == ultimo_slide.slide_id), None)
+
+        for slide_data in custom_slides_data:
+            new_slide = prs.slides.add_slide(template_slide_layout)
+
+            title_text = slide_data.get('title', '')
+            content_text = slide_data.get('content', '')
+
+            if new_slide.shapes.title:
+                new_slide.shapes.title.text = title_text
+            
+            for shape in new_slide.placeholders:
+                if shape.placeholder_format.type in (PP_PLACEHOLDER.BODY, PP_PLACEHOLDER.OBJECT):
+                    shape.text_frame.text = content_text
+                    break
+
+            # O slide novo entra no fim da lista; passa para antes do último slide do modelo
+            if ancora is not None:
+                ancora.addprevious(sldIdLst[-1])
+
+    except Exception as e:
+        print(f"Erro ao adicionar slides customizados: {e}")
+
+
+def remover_slide(prs, i):
+    rId = prs.slides._sldIdLst[i].rId
+    prs.part.drop_rel(rId)
+    del prs.slides._sldIdLst[i]
+
+
+# Relações de slide que existem só por causa de um atributo r:* no XML (r:embed, r:id...);
+# a do layout e a das notas não são referenciadas assim e nunca são removidas
+RELACOES_REFERENCIADAS = {RT.IMAGE, RT.CHART, RT.MEDIA, RT.VIDEO, RT.AUDIO, RT.OLE_OBJECT, RT.PACKAGE}
+XPATH_REFERENCIAS = "//@*[namespace-uri()='http://schemas.openxmlformats.org/officeDocument/2006/relationships']"
+
+
+def remover_partes_orfas(prs):
+    """
+    Remove dos slides as relações com imagens, mídias e gráficos que nenhum elemento
+    referencia mais (shapes apagados ou trocados). Como o save grava apenas as partes
+    alcançáveis pelas relações, as partes que ficam sem nenhuma saem do pacote.
+    Devolve quantas relações foram removidas.
+    """
+    removidas = 0
+    for slide in prs.slides:
+        parte = slide.part
+        referenciados = set(parte._element.xpath(XPATH_REFERENCIAS))
+        for rId, rel in list(parte.rels.items()):
+            if not rel.is_external and rel.reltype in RELACOES_REFERENCIADAS and rId not in referenciados:
+                parte.rels.pop(rId)
+                removidas += 1
+    return removidas
+
+
+def montar_apresentacao(text_substitutions, table_data1, table_data2, campos_ativos, arquivo_excel, slides_a_manter=None, logo_stream=None, custom_slides_json=None, progresso=None, graficos=None):
+    """
+    Monta a apresentação com todas as substituições aplicadas, sem salvar.
+    `slides_a_manter` (números dos slides do modelo) é aplicado já na cópia do modelo,
+    antes dos slides customizados, que são sempre mantidos.
+    `progresso(etapa)`, se informado, é chamado ao entrar na etapa dos gráficos.
+    `graficos` aceita as definições já lidas por carregar_graficos (geração em lote).
+    """
+    with medir_etapa("modelo"):
+        prs, indice = template_cache.obter(slides_a_manter)
+
+    if custom_slides_json:
+        with medir_etapa("slides_customizados"):
+            ids_modelo = {slide.slide_id for slide in prs.slides}
+            adicionar_slides_customizados(prs, custom_slides_json, template_cache.ultimo_slide)
+            # Slides customizados não fazem parte do índice pré-calculado do modelo
+            for slide in prs.slides:
+                if slide.slide_id not in ids_modelo:
+                    indice.indexar_slide(slide)
+
+
+    campos_ativos.extend([
+        "FABRICANTEMODULO", "MODELOMODULO", "POTENCIAMODULO",
+        "FABRICANTEINVERSORES", "MODELOINVERSORES", "POTENCIAINVERSORES",
+        "ESTRUTURA", "SISTEMAMONITORAMENTO",
+        "EQUIPAMENTOSESTRUTURA", "VIDAUTIL", "CERTIFICACAO", "ISOLANTE",
+        "CONTATO", "TENSAO", "PROTECAO", "TEMPOPERACAO",
+        "Manual1", "Manual2", "Manual3", "Manual4", "SOMATOTALFINAL",
+        "FLUXO1", "FLUXO2"
+    ])
+
+    with medir_etapa("substituir_textos"):
+        substituir_textos(prs, text_substitutions, campos_ativos, indice)
+    
+    if logo_stream:
+        with medir_etapa("substituir_logo"):
+            substituir_logo(prs, logo_stream, '{{LOGOCLIENTE}}', indice)
+
+    with medir_etapa("substituir_tabela"):
+        substituir_tabela(prs, '{{FLUXO1}}', table_data1, campos_ativos, indice)
+        substituir_tabela(prs, '{{FLUXO2}}', table_data2, campos_ativos, indice)
+
+    if progresso:
+        progresso("graficos")
+    with medir_etapa("substituir_graficos"):
+        substituir_graficos(prs, arquivo_excel, GRAFICOS_INFO, indice, graficos)
+    with medir_etapa("remover_partes_orfas"):
+        remover_partes_orfas(prs)
+    return prs
+
+
+def create_ppt(*args, **kwargs):
+    prs = montar_apresentacao(*args, **kwargs)
+    buffer = BytesIO()
+    with medir_etapa("salvar"):
+        prs.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+# ===================================================================
+# CONVERSÃO PARA PDF (POOL DO LIBREOFFICE)
+# ===================================================================
+
+class FilaConversaoCheia(RuntimeError):
+    """Todas as instâncias estão ocupadas e a fila de espera atingiu o limite."""
+
+
+class _Medidor:
+    """Contagem, soma e máximo de uma duração em segundos."""
+
+    def __init__(self):
+        self.contagem = 0
+        self.soma = 0.0
+        self.maximo = 0.0
+        self._lock = threading.Lock()
+
+    def registrar(self, segundos):
+        with self._lock:
+            self.contagem += 1
+            self.soma += segundos
+            self.maximo = max(self.maximo, segundos)
+
+    def resumo(self):
+        media = self.soma / self.contagem if self.contagem else 0.0
+        return {"contagem": self.contagem, "media_s": round(media, 4), "maximo_s": round(self.maximo, 4)}
+
+
+def porta_livre():
+    """Porta TCP local livre neste momento, escolhida pelo sistema."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class WorkerLibreOffice:
+    """
+    Instância headless do LibreOffice com perfil próprio (-env:UserInstallation),
+    mantida aberta e controlada via UNO por socket local. Sem o módulo `uno`
+    disponível, cada conversão roda um `soffice --convert-to` avulso, ainda
+    assim com o perfil exclusivo do worker.
+    """
+
+    def __init__(self, indice, porta=None):
+        self.indice = indice
+        self.porta = porta  # None: uma porta livre a cada (re)início
+        self.perfil = tempfile.mkdtemp(prefix=f"lo_perfil_{indice}_")
+        self.processo = None
+        self.inicio_conversao = None
+        self.reinicios = 0
+        self._contexto = None
+        self._desktop = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def uno_disponivel():
+        try:
+            import uno  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def _argumentos_base(self):
+        return [
+            LIBREOFFICE_PATH, "--headless", "--invisible", "--nologo", "--norestore", "--nolockcheck",
+            f"-env:UserInstallation={pathlib.Path(self.perfil).as_uri()}",
+        ]
+
+    def iniciar(self):
+        if not self.uno_disponivel():
+            return
+        porta = self.porta or porta_livre()
+        self.processo = subprocess.Popen(
+            self._argumentos_base() + [f"--accept=socket,host=127.0.0.1,port={porta};urp;StarOffice.ComponentContext"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        limite = time.monotonic() + LIBREOFFICE_TIMEOUT
+        while True:
+            try:
+                self._desktop = self._conectar(porta)
+                return
+            except Exception:
+                if self.processo.poll() is not None or time.monotonic() > limite:
+                    self.encerrar()
+                    raise RuntimeError(f"LibreOffice (worker {self.indice}) não iniciou.")
+                time.sleep(0.25)
+
+    def _conectar(self, porta):
+        import uno
+        contexto_local = uno.getComponentContext()
+        resolver = contexto_local.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver", contexto_local)
+        contexto = resolver.resolve(f"uno:socket,host=127.0.0.1,port={porta};urp;StarOffice.ComponentContext")
+        desktop = contexto.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", contexto)
+        self._contexto = contexto
+        return desktop
+
+    @staticmethod
+    def _propriedades(**valores):
+        from com.sun.star.beans import PropertyValue
+        return tuple(PropertyValue(Name=nome, Value=valor) for nome, valor in valores.items())
+
+    def saudavel(self):
+        """Processo vivo e respondendo pela ponte UNO (ou modo avulso, sempre saudável)."""
+        if not self.uno_disponivel():
+            return True
+        if self.processo is None or self.processo.poll() is not None or self._desktop is None:
+            return False
+        if not self._lock.acquire(blocking=False):
+            return True  # ocupado convertendo; travamentos são tratados pelo monitor
+        try:
+            self._desktop.getFrames()
+            return True
+        except Exception:
+            return False
+        finally:
+            self._lock.release()
+
+    def converter(self, pptx_path, output_dir):
+        pdf_path = os.path.join(output_dir, os.path.splitext(os.path.basename(pptx_path))[0] + ".pdf")
+        with self._lock:
+            self.inicio_conversao = time.monotonic()
+            try:
+                if self.uno_disponivel():
+                    import uno
+                    doc = self._desktop.loadComponentFromURL(
+                        uno.systemPathToFileUrl(os.path.abspath(pptx_path)), "_blank", 0,
+                        self._propriedades(Hidden=True, ReadOnly=True),
+                    )
+                    try:
+                        doc.storeToURL(uno.systemPathToFileUrl(os.path.abspath(pdf_path)),
+                                       self._propriedades(FilterName="impress_pdf_Export"))
+                    finally:
+                        doc.close(True)
+                else:
+                    subprocess.run(
+                        self._argumentos_base() + ["--convert-to", "pdf", "--outdir", output_dir, pptx_path],
+                        check=True, timeout=LIBREOFFICE_TIMEOUT,
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                    )
+            finally:
+                self.inicio_conversao = None
+        return pdf_path
+
+    def renderizar(self, pptx_bytes, largura, altura, formato):
+        """
+        Exporta cada slide do deck (bytes de um .pptx) como imagem de `largura` x
+        `altura` pixels pelo GraphicExportFilter. O deck entra por um SequenceInputStream
+        e cada imagem sai por um Pipe, sem arquivos. Só funciona com a ponte UNO.
+        """
+        import uno
+        with self._lock:
+            self.inicio_conversao = time.monotonic()
+            try:
+                servicos = self._contexto.ServiceManager
+                entrada = servicos.createInstanceWithArgumentsAndContext(
+                    "com.sun.star.io.SequenceInputStream", (uno.ByteSequence(pptx_bytes),), self._contexto)
+                doc = self._desktop.loadComponentFromURL(
+                    "private:stream", "_blank", 0,
+                    self._propriedades(InputStream=entrada, Hidden=True, ReadOnly=True),
+                )
+                try:
+                    exportador = servicos.createInstanceWithContext("com.sun.star.drawing.GraphicExportFilter", self._contexto)
+                    opcoes = {"PixelWidth": largura, "PixelHeight": altura}
+                    if formato == "JPEG":
+                        opcoes["Quality"] = PREVIEW_QUALIDADE
+                    dados_filtro = uno.Any("[]com.sun.star.beans.PropertyValue", self._propriedades(**opcoes))
+                    paginas = doc.getDrawPages()
+                    imagens = []
+                    for i in range(paginas.getCount()):
+                        saida = servicos.createInstanceWithContext("com.sun.star.io.Pipe", self._contexto)
+                        exportador.setSourceDocument(paginas.getByIndex(i))
+                        uno.invoke(exportador, "filter", (self._propriedades(
+                            MediaType=FORMATOS_PREVIEW[formato], OutputStream=saida, FilterData=dados_filtro),))
+                        saida.closeOutput()
+                        buffer = BytesIO()
+                        while True:
+                            lidos, dados = saida.readBytes(None, 1 << 20)
+                            if not lidos:
+                                break
+                            buffer.write(dados.value)
+                        imagens.append(buffer.getvalue())
+                    return imagens
+                finally:
+                    doc.close(True)
+            finally:
+                self.inicio_conversao = None
+
+    def encerrar(self):
+        if self.processo is not None and self.processo.poll() is None:
+            self.processo.kill()
+            self.processo.wait()
+        self.processo = None
+        self._contexto = None
+        self._desktop = None
+
+    def reiniciar(self):
+        with self._lock:
+            self.reinicios += 1
+            self.encerrar()
+            self.iniciar()
+
+
+class PoolLibreOffice:
+    """
+    Pool de instâncias LibreOffice de longa duração. As conversões entram numa fila
+    limitada (FilaConversaoCheia quando lotada); cada worker consome a fila em sua
+    própria thread. Um monitor verifica a saúde das instâncias ociosas e reinicia as
+    que travam por mais de LIBREOFFICE_TIMEOUT numa conversão.
+    """
+
+    def __init__(self, tamanho, tamanho_fila, porta_inicial):
+        self.tamanho = tamanho
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        self._workers = []
+        self._iniciado = False
+        self._lock = threading.Lock()
+        self._porta_inicial = porta_inicial
+        self.espera_fila = _Medidor()
+        self.conversao = _Medidor()
+        self.falhas = 0
+
+    def _iniciar(self):
+        with self._lock:
+            if self._iniciado:
+                return
+            workers = [WorkerLibreOffice(indice, self._porta_inicial and self._porta_inicial + indice)
+                       for indice in range(self.tamanho)]
+            try:
+                for worker in workers:
+                    worker.iniciar()
+            except Exception:
+                for worker in workers:
+                    worker.encerrar()
+                    shutil.rmtree(worker.perfil, ignore_errors=True)
+                raise
+            self._workers = workers
+            for worker in workers:
+                threading.Thread(target=self._consumir, args=(worker,), daemon=True,
+                                 name=f"libreoffice-{worker.indice}").start()
+            threading.Thread(target=self._monitorar, daemon=True, name="libreoffice-monitor").start()
+            atexit.register(self.encerrar)
+            self._iniciado = True
+
+    def _consumir(self, worker):
+        while True:
+            tarefa, futuro, enfileirado_em = self._fila.get()
+            if not futuro.set_running_or_notify_cancel():
+                continue
+            self.espera_fila.registrar(time.monotonic() - enfileirado_em)
+            inicio = time.monotonic()
+            try:
+                if not worker.saudavel():
+                    worker.reiniciar()
+                futuro.set_result(tarefa(worker))
+            except Exception as e:
+                self.falhas += 1
+                if isinstance(e, subprocess.TimeoutExpired) or not worker.saudavel():
+                    futuro.set_exception(RuntimeError("A conversão no LibreOffice demorou demais (timeout)."))
+                    try:
+                        worker.reiniciar()
+                    except Exception as erro_reinicio:
+                        print(f"Erro ao reiniciar LibreOffice (worker {worker.indice}): {erro_reinicio}")
+                else:
+                    futuro.set_exception(RuntimeError(f"Erro ao converter PPTX no LibreOffice: {e}"))
+            finally:
+                self.conversao.registrar(time.monotonic() - inicio)
+
+    def _monitorar(self):
+        while True:
+            time.sleep(LIBREOFFICE_INTERVALO_SAUDE)
+            for worker in self._workers:
+                inicio = worker.inicio_conversao
+                if inicio is not None and time.monotonic() - inicio > LIBREOFFICE_TIMEOUT:
+                    # Matar o processo faz a chamada UNO em andamento falhar; o worker reinicia em seguida
+                    print(f"LibreOffice (worker {worker.indice}) travado; encerrando instância.")
+                    worker.encerrar()
+                elif inicio is None and not worker.saudavel():
+                    try:
+                        worker.reiniciar()
+                    except Exception as e:
+                        print(f"Erro ao reiniciar LibreOffice (worker {worker.indice}): {e}")
+
+    def _executar(self, tarefa):
+        """Enfileira `tarefa(worker)` e espera o resultado."""
+        self._iniciar()
+        futuro = concurrent.futures.Future()
+        try:
+            self._fila.put_nowait((tarefa, futuro, time.monotonic()))
+        except queue.Full:
+            raise FilaConversaoCheia("Muitas pré-visualizações em andamento. Tente novamente em instantes.")
+        return futuro.result()
+
+    def converter(self, pptx_path, output_dir):
+        return self._executar(lambda worker: worker.converter(pptx_path, output_dir))
+
+    def renderizar(self, pptx_bytes, largura, altura, formato):
+        if not WorkerLibreOffice.uno_disponivel():
+            raise RuntimeError("O motor de preview 'uno' exige o módulo uno do LibreOffice.")
+        return self._executar(lambda worker: worker.renderizar(pptx_bytes, largura, altura, formato))
+
+    def usar_portas_livres(self):
+        """Instâncias ainda não iniciadas passam a escutar em portas livres, não nas fixas."""
+        with self._lock:
+            if not self._iniciado:
+                self._porta_inicial = 0
+
+    def estatisticas(self):
+        return {
+            "workers": self.tamanho,
+            "fila": self._fila.qsize(),
+            "fila_maxima": self._fila.maxsize,
+            "falhas": self.falhas,
+            "reinicios": sum(worker.reinicios for worker in self._workers),
+            "espera_fila": self.espera_fila.resumo(),
+            "conversao": self.conversao.resumo(),
+        }
+
+    def encerrar(self):
+        for worker in self._workers:
+            worker.encerrar()
+            shutil.rmtree(worker.perfil, ignore_errors=True)
+
+
+pool_libreoffice = PoolLibreOffice(LIBREOFFICE_WORKERS, LIBREOFFICE_FILA_MAXIMA, LIBREOFFICE_PORTA_INICIAL)
+
+
+def pptx_to_pdf(pptx_path, output_dir):
+    return pool_libreoffice.converter(pptx_path, output_dir)
+
+
+def motor_preview():
+    if PREVIEW_MOTOR == "auto":
+        return "uno" if WorkerLibreOffice.uno_disponivel() else "pdf"
+    return PREVIEW_MOTOR
+
+# ===================================================================
+# PRÉ-VISUALIZAÇÃO INCREMENTAL
+# ===================================================================
+
+class CacheLRU:
+    """
+    Cache LRU limitado pelo total de bytes dos valores armazenados. Com `diretorio`,
+    cada valor também é gravado em disco (limitado a `limite_disco_bytes`, removendo
+    os arquivos acessados há mais tempo) e sobrevive a reinícios do processo.
+    As chaves precisam ser válidas como nome de arquivo.
+    """
+
+    def __init__(self, limite_bytes, diretorio=None, limite_disco_bytes=0):
+        self.limite_bytes = limite_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.hits_disco = 0
+        self.diretorio = diretorio
+        self.limite_disco_bytes = limite_disco_bytes
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+    def obter(self, chave):
+        with self._lock:
+            valor = self._itens.get(chave)
+            if valor is not None:
+                self._itens.move_to_end(chave)
+                self.hits += 1
+                return valor
+        valor = self._ler_disco(chave)
+        with self._lock:
+            if valor is None:
+                self.misses += 1
+                return None
+            self.hits_disco += 1
+            self._guardar_memoria(chave, valor)
+            return valor
+
+    def guardar(self, chave, valor):
+        with self._lock:
+            self._guardar_memoria(chave, valor)
+        self._gravar_disco(chave, valor)
+
+    def _guardar_memoria(self, chave, valor):
+        if len(valor) > self.limite_bytes:
+            return
+        anterior = self._itens.pop(chave, None)
+        if anterior is not None:
+            self.total_bytes -= len(anterior)
+        self._itens[chave] = valor
+        self.total_bytes += len(valor)
+        while self.total_bytes > self.limite_bytes:
+            _, removido = self._itens.popitem(last=False)
+            self.total_bytes -= len(removido)
+
+    def _ler_disco(self, chave):
+        if not self.diretorio:
+            return None
+        caminho = os.path.join(self.diretorio, chave)
+        try:
+            with open(caminho, "rb") as f:
+                valor = f.read()
+            os.utime(caminho)
+            return valor
+        except OSError:
+            return None
+
+    def _gravar_disco(self, chave, valor):
+        if not self.diretorio or len(valor) > self.limite_disco_bytes:
+            return
+        caminho = os.path.join(self.diretorio, chave)
+        try:
+            with tempfile.NamedTemporaryFile(dir=self.diretorio, delete=False, suffix=".tmp") as tmp:
+                tmp.write(valor)
+            os.replace(tmp.name, caminho)
+            self._podar_disco()
+        except OSError as e:
+            print(f"AVISO: não foi possível gravar '{chave}' no cache em disco: {e}")
+
+    def _podar_disco(self):
+        arquivos = []
+        total = 0
+        with os.scandir(self.diretorio) as entradas:
+            for entrada in entradas:
+                if entrada.is_file() and not entrada.name.endswith(".tmp"):
+                    st = entrada.stat()
+                    arquivos.append((st.st_mtime, st.st_size, entrada.path))
+                    total += st.st_size
+        arquivos.sort()
+        for _, tamanho, caminho in arquivos:
+            if total <= self.limite_disco_bytes:
+                break
+            try:
+                os.remove(caminho)
+                total -= tamanho
+            except OSError:
+                pass
+
+    def estatisticas(self):
+        return {"itens": len(self._itens), "bytes": self.total_bytes, "limite_bytes": self.limite_bytes,
+                "hits": self.hits, "hits_disco": self.hits_disco, "misses": self.misses,
+                "diretorio": self.diretorio}
+
+
+cache_slides = CacheLRU(
+    PREVIEW_CACHE_BYTES,
+    os.path.join(RESULTADOS_CACHE_DIR, "slides") if RESULTADOS_CACHE_DIR else None,
+    RESULTADOS_CACHE_DISCO_BYTES // 2,
+)
+# Logos já reduzidos e reconvertidos (ver preparar_logo)
+cache_logos = CacheLRU(LOGO_CACHE_BYTES)
+
+
+def hash_slide(slide, posicao, versao_modelo):
+    """
+    Hash do conteúdo renderizável do slide após as substituições: XML do slide e
+    conteúdo das partes relacionadas (imagens, gráficos). Layouts e masters vêm do
+    modelo e são cobertos pela versão dele. A posição só entra quando o slide exibe
+    o número do slide.
+    """
+    h = hashlib.sha1(str(versao_modelo).encode())
+    xml = slide.part.blob
+    h.update(xml)
+    for rId, rel in sorted(slide.part.rels.items()):
+        h.update(f"{rId}|{rel.reltype}|".encode())
+        if rel.is_external:
+            h.update(rel.target_ref.encode())
+        elif rel.reltype in (RT.SLIDE_LAYOUT, RT.NOTES_SLIDE):
+            h.update(str(rel.target_part.partname).encode())
+        else:
+            h.update(hashlib.sha1(rel.target_part.blob).digest())
+    if b'type="slidenum"' in xml:
+        h.update(f"|{posicao}".encode())
+    return h.hexdigest()
+
+
+def slide_oculto(slide):
+    return slide._element.get("show") in ("0", "false")
+
+
+def fixar_numeros_slides(prs, slide_ids):
+    """
+    Troca os campos de número do slide (a:fld type="slidenum") dos slides indicados por
+    texto com o número que eles têm no deck completo, que deixaria de ser o exibido
+    depois de os demais slides serem removidos (o hash do slide já considera a posição).
+    """
+    primeiro = int(prs.part._element.get("firstSlideNum", "1"))
+    for posicao, slide in enumerate(prs.slides):
+        if slide.slide_id not in slide_ids:
+            continue
+        for campo in slide._element.xpath('.//a:fld[@type="slidenum"]'):
+            run = campo.makeelement(qn("a:r"), {})
+            propriedades = campo.find(qn("a:rPr"))
+            if propriedades is not None:
+                run.append(copy.deepcopy(propriedades))
+            texto = run.makeelement(qn("a:t"), {})
+            texto.text = str(primeiro + posicao)
+            run.append(texto)
+            campo.addprevious(run)
+            campo.getparent().remove(campo)
+
+
+def converter_slides_pdf(pptx_bytes):
+    """Converte o deck (bytes de um .pptx) para PDF, uma página por slide visível. Devolve o caminho do PDF."""
+    pptx_temp_file = None
+    try:
+        with tempfile.NamedTemporaryFile(dir=DIRETORIO_TEMPORARIO, delete=False, suffix=".pptx") as tmp_pptx:
+            tmp_pptx.write(pptx_bytes)
+            pptx_temp_file = tmp_pptx.name
+        with medir_etapa("pptx_to_pdf"):
+            return pptx_to_pdf(pptx_temp_file, os.path.dirname(pptx_temp_file))
+    finally:
+        if pptx_temp_file and os.path.exists(pptx_temp_file):
+            try:
+                os.remove(pptx_temp_file)
+            except Exception as e:
+                print(f"Erro ao remover arquivo temporário {pptx_temp_file}: {e}")
+
+
+def renderizar_slides(prs, slide_ids, dpi=PREVIEW_DPI, formato=PREVIEW_FORMATO, pptx_bytes=None):
+    """
+    Renderiza apenas os slides indicados (os demais são removidos desta cópia do
+    deck), na ordem do deck. Devolve (gerador das imagens codificadas, PDF temporário
+    ou None); quem consome o gerador remove o PDF ao terminar. `pptx_bytes` (o deck
+    já salvo) é usado no lugar de salvar de novo quando nenhum slide é removido.
+
+    No motor "uno" o deck vai em memória para o LibreOffice e as imagens voltam
+    prontas; WEBP, que o exportador não gera, é reconvertido a partir do PNG. No
+    motor "pdf" a conversão acontece aqui e a rasterização fica para o gerador.
+    """
+    manter = set(slide_ids)
+    remover = [i for i, sld in enumerate(prs.slides._sldIdLst) if sld.id not in manter]
+    if remover:
+        fixar_numeros_slides(prs, manter)
+    for i in reversed(remover):
+        remover_slide(prs, i)
+    if remover or pptx_bytes is None:
+        buffer = BytesIO()
+        with medir_etapa("salvar"):
+            prs.save(buffer)
+        pptx_bytes = buffer.getvalue()
+
+    if motor_preview() != "uno":
+        pdf_path = converter_slides_pdf(pptx_bytes)
+        return rasterizar_paginas(pdf_path, dpi, formato), pdf_path
+
+    largura = round(prs.slide_width * dpi / EMU_POR_POLEGADA)
+    altura = round(prs.slide_height * dpi / EMU_POR_POLEGADA)
+    exportado = formato if formato in ("JPEG", "PNG") else "PNG"
+    with medir_etapa("renderizar_slides"):
+        imagens = pool_libreoffice.renderizar(pptx_bytes, largura, altura, exportado)
+
+    def recodificar():
+        for imagem in imagens:
+            if exportado != formato:
+                with medir_etapa("codificar_imagem"), Image.open(BytesIO(imagem)) as img:
+                    saida = BytesIO()
+                    img.save(saida, format=formato, quality=PREVIEW_QUALIDADE)
+                    imagem = saida.getvalue()
+            yield imagem
+    return recodificar(), None
+
+
+# O pdf2image só é importado quando o motor "pdf" é usado de fato
+def pdfinfo_from_path(*args, **kwargs):
+    import pdf2image
+    return pdf2image.pdfinfo_from_path(*args, **kwargs)
+
+
+def convert_from_path(*args, **kwargs):
+    import pdf2image
+    return pdf2image.convert_from_path(*args, **kwargs)
+
+
+def rasterizar_paginas(pdf_path, dpi=PREVIEW_DPI, formato=PREVIEW_FORMATO):
+    """
+    Gera as páginas do PDF já codificadas, em ordem. Cada página é rasterizada
+    isoladamente (first_page/last_page) em um pool pequeno de threads, então só
+    algumas imagens descomprimidas existem em memória ao mesmo tempo.
+    """
+    total = pdfinfo_from_path(pdf_path, poppler_path=POPPLER_PATH)["Pages"]
+    opcoes = {} if formato == "PNG" else {"quality": PREVIEW_QUALIDADE}
+    # As páginas são rasterizadas em threads do pool, fora do contexto da requisição
+    rastreamento = rastreamento_atual()
+
+    def pagina(numero):
+        with medir_etapa("convert_from_path", rastreamento):
+            img = convert_from_path(pdf_path, dpi=dpi, first_page=numero, last_page=numero, poppler_path=POPPLER_PATH)[0]
+        with medir_etapa("codificar_imagem", rastreamento):
+            buffered = BytesIO()
+            img.save(buffered, format=formato, **opcoes)
+            img.close()
+        return buffered.getvalue()
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=PREVIEW_THREADS)
+    try:
+        pendentes = {}
+        proxima = 1
+        for numero in range(1, total + 1):
+            # Mantém no máximo PREVIEW_THREADS páginas à frente da que está sendo entregue
+            while len(pendentes) >= PREVIEW_THREADS:
+                yield pendentes.pop(proxima).result()
+                proxima += 1
+            pendentes[numero] = executor.submit(pagina, numero)
+        while pendentes:
+            yield pendentes.pop(proxima).result()
+            proxima += 1
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def listar_slides_preview(prs, dpi=PREVIEW_DPI, formato=PREVIEW_FORMATO):
+    """[(slide_id, hash)] dos slides visíveis, na ordem; o hash inclui resolução, formato, motor e código."""
+    versao = f"{VERSAO_CODIGO}|{template_cache.versao}|{dpi}|{formato}|{motor_preview()}"
+    return [
+        (slide.slide_id, hash_slide(slide, posicao, versao))
+        for posicao, slide in enumerate(prs.slides) if not slide_oculto(slide)
+    ]
+
+
+def preview_incremental(slides, obter_prs, slides_conhecidos, dpi=PREVIEW_DPI, formato=PREVIEW_FORMATO,
+                        pptx_bytes=None):
+    """
+    Prepara o /preview a partir de listar_slides_preview. Só os slides ausentes do
+    cache do servidor passam pelo LibreOffice, e só nesse caso `obter_prs()` é chamado
+    para montar o deck; a conversão acontece aqui, antes da resposta começar (ver
+    renderizar_slides). `pptx_bytes`, se dado, é o deck de `obter_prs()` já salvo.
+
+    Retorna (cabeçalho, gerador de itens). A imagem de um item só é enviada quando o
+    cliente ainda não tem aquele hash.
+    """
+    imagens = {}
+    for slide_id, hash_conteudo in slides:
+        imagem = cache_slides.obter(hash_conteudo)
+        if imagem is not None:
+            imagens[hash_conteudo] = imagem
+
+    faltando = {slide_id for slide_id, hash_conteudo in slides if hash_conteudo not in imagens}
+    if faltando:
+        paginas, pdf_path = renderizar_slides(obter_prs(), faltando, dpi, formato, pptx_bytes)
+    else:
+        paginas, pdf_path = iter(()), None
+
+    def itens():
+        try:
+            for indice, (slide_id, hash_conteudo) in enumerate(slides):
+                if slide_id in faltando:
+                    imagem = next(paginas)
+                    cache_slides.guardar(hash_conteudo, imagem)
+                else:
+                    imagem = imagens[hash_conteudo]
+                item = {"indice": indice, "id": f"slide-{slide_id}", "hash": hash_conteudo}
+                if hash_conteudo not in slides_conhecidos:
+                    item["imagem"] = base64.b64encode(imagem).decode("utf-8")
+                yield item
+        finally:
+            if faltando:
+                paginas.close()
+            if pdf_path:
+                try:
+                    os.remove(pdf_path)
+                except Exception as e:
+                    print(f"Erro ao remover arquivo temporário {pdf_path}: {e}")
+
+    cabecalho = {"total": len(slides), "renderizados": len(faltando), "formato": FORMATOS_PREVIEW[formato]}
+    return cabecalho, itens()
+
+
+def opcoes_preview(form):
+    """Lê dpi e formato pedidos pelo cliente, limitados aos valores suportados."""
+    try:
+        dpi = int(form.get("dpi", PREVIEW_DPI))
+    except ValueError:
+        dpi = PREVIEW_DPI
+    dpi = min(max(dpi, 30), PREVIEW_DPI_MAXIMO)
+    formato = form.get("formato", PREVIEW_FORMATO).upper()
+    if formato not in FORMATOS_PREVIEW:
+        formato = PREVIEW_FORMATO
+    return dpi, formato
+
+
+def stream_ndjson(cabecalho, itens):
+    """Uma linha JSON para o cabeçalho e uma por slide, enviadas à medida que ficam prontas."""
+    yield json.dumps(cabecalho) + "\n"
+    try:
+        for item in itens:
+            yield json.dumps(item) + "\n"
+    except Exception as e:
+        traceback.print_exc()
+        yield json.dumps({"error": f"Erro no preview: {e}"}) + "\n"
+    finally:
+        itens.close()
+
+# ===================================================================
+# CACHE DE RESULTADOS
+# ===================================================================
+
+# Campos do formulário que não mudam o .pptx gerado
+CAMPOS_FORA_DA_CHAVE = {"slides_conhecidos", "slide", "dpi", "formato", "stream", "tipo", "planilha_token"}
+
+cache_resultados = CacheLRU(RESULTADOS_CACHE_BYTES, RESULTADOS_CACHE_DIR or None, RESULTADOS_CACHE_DISCO_BYTES // 2)
+
+
+def calcular_versao_codigo():
+    """
+    Hash do código que monta as apresentações: este arquivo, a versão do python-pptx e
+    a configuração que muda a saída (intervalos das tabelas). Muda a cada deploy que
+    altera a saída, invalidando os resultados guardados em disco.
+    """
+    h = hashlib.sha256()
+    with open(os.path.abspath(__file__), "rb") as f:
+        h.update(f.read())
+    h.update(f"|python-pptx {pptx.__version__}".encode())
+    h.update(f"|{INTERVALO_TABELA1}|{INTERVALO_TABELA2}|{TABELA_LINHAS_POR_SLIDE}".encode())
+    return h.hexdigest()[:16]
+
+
+VERSAO_CODIGO = calcular_versao_codigo()
+
+
+def chave_entrada(file_bytes, logo_bytes, form, hash_planilha=None):
+    """
+    Hash canônico de tudo o que determina a proposta: versão do código e do modelo,
+    planilha, logo e campos do formulário. Campos com vários valores (campos, slides_a_manter)
+    são tratados como conjuntos, então a ordem em que chegam não muda a chave.
+    `hash_planilha` evita recalcular o sha256 de uma planilha de sessão.
+    """
+    h = hashlib.sha256()
+    h.update(f"codigo:{VERSAO_CODIGO}\n".encode())
+    h.update(f"modelo:{template_cache.versao_atual()}\n".encode())
+    h.update(f"planilha:{hash_planilha or hashlib.sha256(file_bytes).hexdigest()}\n".encode())
+    h.update(f"logo:{hashlib.sha256(logo_bytes).hexdigest() if logo_bytes else ''}\n".encode())
+    for campo in sorted(form.keys()):
+        if campo in CAMPOS_FORA_DA_CHAVE:
+            continue
+        h.update(json.dumps([campo, sorted(form.getlist(campo))]).encode())
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def guardar_pptx(chave, prs):
+    """Salva a apresentação, guarda os bytes no cache de resultados e os devolve."""
+    buffer = BytesIO()
+    with medir_etapa("salvar"):
+        prs.save(buffer)
+    pptx_bytes = buffer.getvalue()
+    cache_resultados.guardar(f"pptx-{chave}", pptx_bytes)
+    return pptx_bytes
+
+
+# ===================================================================
+# JOBS ASSÍNCRONOS
+# ===================================================================
+
+ETAPAS_JOB = ["ingestao", "substituicao", "graficos", "conversao", "rasterizacao"]
+ESTADOS_FINAIS = {"concluido", "erro", "cancelado"}
+
+
+class FilaJobsCheia(RuntimeError):
+    """Há JOBS_FILA_MAXIMA jobs pendentes; o cliente deve tentar de novo mais tarde."""
+
+
+class JobCancelado(Exception):
+    pass
+
+
+class Job:
+    """Estado de um job; toda alteração passa por `atualizar`, que acorda quem espera em `aguardar`."""
+
+    def __init__(self, tipo):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo
+        self.estado = "na_fila"
+        self.etapa = None
+        self.etapas = {}
+        self.paginas = None
+        self.erro = None
+        self.resultado = None
+        self.tamanho_resultado = 0
+        self.cancelado = False
+        self.criado_em = time.time()
+        self.finalizado_em = None
+        self.versao = 0
+        self.future = None
+        self._condicao = threading.Condition()
+
+    def atualizar(self, **campos):
+        with self._condicao:
+            if campos.get("etapa") is not None and campos["etapa"] != self.etapa:
+                self.etapas[campos["etapa"]] = round(time.time() - self.criado_em, 3)
+            for nome, valor in campos.items():
+                setattr(self, nome, valor)
+            if self.estado in ESTADOS_FINAIS and self.finalizado_em is None:
+                self.finalizado_em = time.time()
+            self.versao += 1
+            self._condicao.notify_all()
+
+    def aguardar(self, versao, timeout):
+        """Espera até a versão mudar (ou o timeout) e devolve a versão atual."""
+        with self._condicao:
+            self._condicao.wait_for(lambda: self.versao != versao, timeout)
+            return self.versao
+
+    def resumo(self):
+        return {
+            "id": self.id,
+            "tipo": self.tipo,
+            "estado": self.estado,
+            "etapa": self.etapa,
+            "etapas": dict(self.etapas),
+            "paginas": self.paginas,
+            "erro": self.erro,
+            "criado_em": self.criado_em,
+            "duracao_s": round((self.finalizado_em or time.time()) - self.criado_em, 3),
+        }
+
+
+def contexto_processos():
+    """
+    Contexto dos pools de processos. Nunca "fork": o servidor já tem threads rodando,
+    e um processo criado por fork no meio de uma requisição herdaria presas as travas
+    que elas estivessem segurando (a do cache do modelo, por exemplo). O forkserver cria
+    os processos a partir de um servidor limpo que já importou este módulo.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        contexto = multiprocessing.get_context("forkserver")
+        contexto.set_forkserver_preload([__name__])
+        return contexto
+    return multiprocessing.get_context("spawn")
+
+
+# Fila de progresso compartilhada com os processos do pool (definida no initializer)
+_fila_progresso = None
+
+
+def _iniciar_processo_job(fila, caminho_modelo):
+    global _fila_progresso, template_cache
+    _fila_progresso = fila
+    # Os processos do pool começam sem o modelo carregado
+    if template_cache.caminho != caminho_modelo:
+        template_cache = CacheTemplate(caminho_modelo)
+    aquecer(preview=False)
+
+
+def _montar_em_processo(job_id, file_bytes, logo_bytes, itens_form, dpi, formato, com_preview):
+    """
+    Executada no processo do pool: monta a apresentação e devolve (bytes do .pptx,
+    lista de slides do preview ou None). As etapas são avisadas pela fila de progresso.
+    """
+    def progresso(etapa):
+        _fila_progresso.put((job_id, etapa))
+
+    prs = montar_apresentacao_da_requisicao(file_bytes, logo_bytes, MultiDict(itens_form), progresso)
+    buffer = BytesIO()
+    prs.save(buffer)
+    slides = listar_slides_preview(prs, dpi, formato) if com_preview else None
+    return buffer.getvalue(), slides
+
+
+class GerenciadorJobs:
+    """
+    Executa /generate e /preview fora da thread da requisição. A montagem da
+    apresentação (python-pptx, presa ao GIL) roda num pool de JOBS_PROCESSOS
+    processos; conversão e rasterização continuam neste processo, que já é dono do
+    pool do LibreOffice. Uma thread coordenadora por job em execução (no máximo
+    JOBS_PROCESSOS) encadeia as etapas; os demais aguardam na fila.
+    """
+
+    def __init__(self, processos, fila_maxima, limite_resultados_bytes):
+        self.processos = processos
+        self.fila_maxima = fila_maxima
+        self.limite_resultados_bytes = limite_resultados_bytes
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._processos = None
+        self._coordenadores = None
+        self._fila_progresso = None
+        self.concluidos = 0
+        self.falhas = 0
+        self.cancelados = 0
+
+    def _iniciar(self):
+        with self._lock:
+            if self._processos is not None:
+                return
+            contexto = contexto_processos()
+            opcoes = {"max_tasks_per_child": JOBS_TAREFAS_POR_PROCESSO} if JOBS_TAREFAS_POR_PROCESSO else {}
+            self._fila_progresso = contexto.Queue()
+            self._processos = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.processos, mp_context=contexto, initializer=_iniciar_processo_job,
+                initargs=(self._fila_progresso, template_cache.caminho), **opcoes
+            )
+            self._coordenadores = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.processos, thread_name_prefix="job"
+            )
+            threading.Thread(target=self._ler_progresso, daemon=True, name="jobs-progresso").start()
+            atexit.register(self.encerrar)
+
+    def _ler_progresso(self):
+        while True:
+            try:
+                job_id, etapa = self._fila_progresso.get()
+            except (EOFError, OSError):
+                return
+            job = self._jobs.get(job_id)
+            if job is not None and job.estado == "executando":
+                job.atualizar(etapa=etapa)
+
+    def _limpar_expirados(self):
+        """
+        Descarta os jobs finalizados há mais de JOBS_TTL e, enquanto os resultados
+        guardados passarem de `limite_resultados_bytes`, os finalizados há mais tempo.
+        Chamada com o lock.
+        """
+        limite = time.time() - JOBS_TTL
+        for job_id, job in list(self._jobs.items()):
+            if job.finalizado_em is not None and job.finalizado_em < limite:
+                del self._jobs[job_id]
+        total = sum(job.tamanho_resultado for job in self._jobs.values())
+        if total <= self.limite_resultados_bytes:
+            return
+        finalizados = sorted((job for job in self._jobs.values() if job.finalizado_em is not None),
+                             key=lambda job: job.finalizado_em)
+        # O último a terminar fica, mesmo sozinho acima do limite, para poder ser baixado
+        for job in finalizados[:-1]:
+            if total <= self.limite_resultados_bytes:
+                break
+            total -= job.tamanho_resultado
+            del self._jobs[job.id]
+
+    def submeter(self, tipo, file_bytes, logo_bytes, form):
+        self._iniciar()
+        with self._lock:
+            self._limpar_expirados()
+            pendentes = sum(1 for job in self._jobs.values() if job.estado not in ESTADOS_FINAIS)
+            if pendentes >= self.fila_maxima:
+                raise FilaJobsCheia(f"Há {pendentes} jobs pendentes; tente novamente em instantes.")
+            job = Job(tipo)
+            self._jobs[job.id] = job
+        job.future = self._coordenadores.submit(self._executar, job, file_bytes, logo_bytes, form)
+        return job
+
+    def obter(self, job_id):
+        with self._lock:
+            self._limpar_expirados()
+            return self._jobs.get(job_id)
+
+    def cancelar(self, job_id):
+        """Cancela o job. Um job ainda na fila nem começa; um em execução para na próxima etapa."""
+        job = self.obter(job_id)
+        if job is None or job.estado in ESTADOS_FINAIS:
+            return job
+        job.cancelado = True
+        if job.future is not None and job.future.cancel():
+            self.cancelados += 1
+            job.atualizar(estado="cancelado")
+        return job
+
+    def _verificar_cancelamento(self, job):
+        if job.cancelado:
+            raise JobCancelado()
+
+    def _executar(self, job, file_bytes, logo_bytes, form):
+        try:
+            self._verificar_cancelamento(job)
+            job.atualizar(estado="executando")
+            if job.tipo == "preview":
+                resultado = self._executar_preview(job, file_bytes, logo_bytes, form)
+                tamanho = sum(len(item.get("imagem", "")) for item in resultado["slides"])
+            else:
+                resultado = self._executar_generate(job, file_bytes, logo_bytes, form)
+                tamanho = len(resultado)
+            self.concluidos += 1
+            job.atualizar(estado="concluido", etapa=None, resultado=resultado, tamanho_resultado=tamanho)
+            # Sem novos envios, a limpeza também acontece aqui, a cada job concluído
+            with self._lock:
+                self._limpar_expirados()
+        except JobCancelado:
+            self.cancelados += 1
+            job.atualizar(estado="cancelado")
+        except FilaConversaoCheia as e:
+            self.falhas += 1
+            job.atualizar(estado="erro", erro=str(e))
+        except Exception as e:
+            traceback.print_exc()
+            self.falhas += 1
+            job.atualizar(estado="erro", erro=f"Erro no job: {e}")
+
+    def _montar(self, job, file_bytes, logo_bytes, form, dpi=PREVIEW_DPI, formato=PREVIEW_FORMATO, com_preview=False):
+        future = self._processos.submit(
+            _montar_em_processo, job.id, file_bytes, logo_bytes, list(form.items(multi=True)), dpi, formato, com_preview
+        )
+        while True:
+            try:
+                return future.result(timeout=0.5)
+            except concurrent.futures.TimeoutError:
+                if job.cancelado and future.cancel():
+                    raise JobCancelado()
+
+    def _executar_generate(self, job, file_bytes, logo_bytes, form):
+        chave = chave_entrada(file_bytes, logo_bytes, form)
+        pptx_bytes = cache_resultados.obter(f"pptx-{chave}")
+        if pptx_bytes is None:
+            pptx_bytes, _ = self._montar(job, file_bytes, logo_bytes, form)
+            cache_resultados.guardar(f"pptx-{chave}", pptx_bytes)
+        self._verificar_cancelamento(job)
+        return pptx_bytes
+
+    def _executar_preview(self, job, file_bytes, logo_bytes, form):
+        dpi, formato = opcoes_preview(form)
+        slides_conhecidos = set(form.getlist("slides_conhecidos"))
+        chave = chave_entrada(file_bytes, logo_bytes, form)
+        chave_preview = f"preview-{chave}-{dpi}-{formato}"
+        pptx_bytes = None
+        slides = cache_resultados.obter(chave_preview)
+        if slides is None:
+            pptx_bytes, slides = self._montar(job, file_bytes, logo_bytes, form, dpi, formato, com_preview=True)
+            cache_resultados.guardar(f"pptx-{chave}", pptx_bytes)
+            cache_resultados.guardar(chave_preview, json.dumps(slides).encode())
+        else:
+            slides = [tuple(slide) for slide in json.loads(slides)]
+
+        def obter_prs():
+            if pptx_bytes is not None:
+                return Presentation(BytesIO(pptx_bytes))
+            return self._montar_e_abrir(job, file_bytes, logo_bytes, form)
+
+        self._verificar_cancelamento(job)
+        job.atualizar(etapa="conversao")
+        cabecalho, itens = preview_incremental(slides, obter_prs, slides_conhecidos, dpi, formato, pptx_bytes)
+        job.atualizar(etapa="rasterizacao", paginas={"feitas": 0, "total": len(slides)})
+        resultado = []
+        try:
+            for item in itens:
+                self._verificar_cancelamento(job)
+                resultado.append(item)
+                job.atualizar(paginas={"feitas": len(resultado), "total": len(slides)})
+        finally:
+            itens.close()
+        return dict(cabecalho, slides=resultado)
+
+    def _montar_e_abrir(self, job, file_bytes, logo_bytes, form):
+        pptx_bytes, _ = self._montar(job, file_bytes, logo_bytes, form)
+        return Presentation(BytesIO(pptx_bytes))
+
+    def estatisticas(self):
+        with self._lock:
+            estados = {}
+            for job in self._jobs.values():
+                estados[job.estado] = estados.get(job.estado, 0) + 1
+            bytes_resultados = sum(job.tamanho_resultado for job in self._jobs.values())
+        return {"processos": self.processos, "fila_maxima": self.fila_maxima, "estados": estados,
+                "bytes_resultados": bytes_resultados, "limite_resultados_bytes": self.limite_resultados_bytes,
+                "concluidos": self.concluidos, "falhas": self.falhas, "cancelados": self.cancelados}
+
+    def encerrar(self):
+        if self._processos is not None:
+            self._processos.shutdown(wait=False, cancel_futures=True)
+            self._coordenadores.shutdown(wait=False, cancel_futures=True)
+
+
+gerenciador_jobs = GerenciadorJobs(JOBS_PROCESSOS, JOBS_FILA_MAXIMA, JOBS_RESULTADOS_BYTES)
 
-# Caminhos externos - AJUSTE ESTES CAMINHOS PARA O SEU AMBIENTE
-POPPLER_PATH = r"C:\Users\fixxi\Desktop\STYLUX_PPTGEN\Back\POPPLER\Library\bin"
-LIBREOFFICE_PATH = r"C:\Program Files\LibreOffice\program\soffice.exe"
 
 # ===================================================================
-# FUNÇÕES DE APOIO
+# GERAÇÃO EM LOTE
 # ===================================================================
 
-def format_cell(cell):
-    if cell.value is None:
-        return ""
-    if '%' in str(cell.number_format):
-        try:
-            return f"{float(cell.value):.2%}".replace('.', ',')
-        except (ValueError, TypeError):
-            return str(cell.value)
-    if 'R$' in str(cell.number_format) or 'BRL' in str(cell.number_format):
-        try:
-            return locale.currency(float(cell.value), grouping=True)
-        except (ValueError, TypeError):
-            return str(cell.value)
-    if isinstance(cell.value, (float, int)):
-        return f"{cell.value:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-    return str(cell.value)
-
-def build_table_data(ws_formats, ws_values, range_string):
-    table_data = []
-    for row_format, row_value in zip(ws_formats[range_string], ws_values[range_string]):
-        new_row = []
-        for cell_format, cell_value in zip(row_format, row_value):
-            cell_format.value = cell_value.value
-            new_row.append(format_cell(cell_format))
-        table_data.append(new_row)
-    return table_data
-
-
-def substituir_textos(prs, substituicoes, campos_ativos):
-    for slide in prs.slides:
-        for shape in slide.shapes:
-            if not shape.has_text_frame or shape.has_table:
-                continue
-            for paragraph in shape.text_frame.paragraphs:
-                runs_data = [(run.text, run.font) for run in paragraph.runs]
-                full_text = ''.join(run.text for run in paragraph.runs)
-                original_text = full_text
-
-                for chave, valor in substituicoes.items():
-                    nome_campo = chave.strip('{} ')
-                    if nome_campo in campos_ativos and chave in full_text:
-                        full_text = full_text.replace(chave, str(valor) if valor is not None else "")
-
-                placeholders_inativos = {chave for chave in substituicoes if chave.strip('{} ') not in campos_ativos}
-                for chave_inativa in placeholders_inativos:
-                    if chave_inativa in full_text:
-                        full_text = full_text.replace(chave_inativa, "")
-
-                if original_text != full_text:
-                    for _ in range(len(paragraph.runs)):
-                        p = paragraph.runs[0]._r
-                        p.getparent().remove(p)
-                    if runs_data:
-                        new_run = paragraph.add_run()
-                        new_run.text = full_text
-                        original_font = runs_data[0][1]
-                        new_run.font.name = original_font.name
-                        new_run.font.size = original_font.size
-                        new_run.font.bold = original_font.bold
-                        new_run.font.italic = original_font.italic
-                        new_run.font.underline = original_font.underline
-                        original_color = original_font.color
-                        if original_color.type == MSO_COLOR_TYPE.RGB:
-                            new_run.font.color.rgb = original_color.rgb
-                        elif original_color.type == MSO_COLOR_TYPE.SCHEME:
-                            new_run.font.color.theme_color = original_color.theme_color
-                            new_run.font.color.brightness = original_color.brightness
-                    else:
-                        paragraph.add_run().text = full_text
-
-def substituir_logo(prs, logo_stream, placeholder):
-    for slide in prs.slides:
-        for shape in list(slide.shapes):
-            if not shape.has_text_frame:
-                continue
-            if placeholder in shape.text_frame.text:
-                logo_stream.seek(0)
-                left, top, width, height = shape.left, shape.top, shape.width, shape.height
-                sp = shape._sp
-                sp.getparent().remove(sp)
-                slide.shapes.add_picture(logo_stream, left, top, width, height)
-
-def substituir_tabela(slide, placeholder, table_data, campos_ativos):
-    if placeholder.strip('{} ') not in campos_ativos:
-        for shape in slide.shapes:
-            if shape.has_text_frame and placeholder.lower() in shape.text_frame.text.lower():
-                sp = shape._sp
-                sp.getparent().remove(sp)
-        return
+ItemLote = namedtuple("ItemLote", ["nome", "planilha", "linha"])
 
-    shape_to_replace = None
-    for shape in slide.shapes:
-        if shape.has_text_frame and placeholder.lower() in shape.text_frame.text.lower():
-            shape_to_replace = shape
-            break
-    if shape_to_replace:
-        left, top, width, height = shape_to_replace.left, shape_to_replace.top, shape_to_replace.width, shape_to_replace.height
+# Campos usados pela linha de comando quando --campo não é informado (os mesmos
+# marcados por padrão na interface)
+CAMPOS_PADRAO_LOTE = [key for key in TEXT_KEYS if key] + ["FLUXO1", "FLUXO2"]
 
-        sp = shape_to_replace._sp
-        sp.getparent().remove(sp)
 
-        num_rows = len(table_data)
-        num_cols = len(table_data[0]) if table_data else 0
-        if num_rows == 0 or num_cols == 0:
-            return
+def _nome_arquivo_seguro(texto):
+    return re.sub(r"[^\w.-]+", "_", str(texto)).strip("._") or "proposta"
 
-        table_shape = slide.shapes.add_table(num_rows, num_cols, left, top, width, height)
-        tbl = table_shape.table
-        for r_idx, row_data in enumerate(table_data):
-            for c_idx, cell_data in enumerate(row_data):
-                cell = tbl.cell(r_idx, c_idx)
-                cell.text = str(cell_data)
-                para = cell.text_frame.paragraphs[0]
-                para.font.size = Pt(15)
-                para.font.name = 'Calibri'
-                para.font.color.rgb = RGBColor(0, 0, 0)
-                if r_idx == 0:
-                    para.font.bold = True
-                    cell.fill.solid()
-                    cell.fill.fore_color.rgb = RGBColor(220, 220, 220)
-
-
-def substituir_graficos(prs, excel_path, graficos_info):
-    """
-    Substitui placeholders de gráficos no PPT com imagens do Excel de forma robusta.
-    """
-    print("--- Iniciando substituição de gráficos ---")
-    excel = None
-    wb = None
-    
+
+def _eh_xlsx(file_bytes):
     try:
-        pythoncom.CoInitialize()
-        excel = win32.gencache.EnsureDispatch("Excel.Application")
-        excel.Visible = False
-        excel.DisplayAlerts = False
-
-        print(f"Abrindo workbook: {excel_path}")
-        wb = excel.Workbooks.Open(excel_path)
-        
-        print("Atualizando dados e gráficos no Excel...")
-        wb.RefreshAll()
-        excel.CalculateUntilAsyncQueriesDone()
-        
-        # Otimização: Mapeia todos os gráficos do Excel primeiro
-        charts_map = {}
-        for ws in wb.Worksheets:
-            try:
-                for chart_object in ws.ChartObjects():
-                    charts_map[chart_object.Name] = chart_object
-            except Exception:
-                # Planilha pode não ter ChartObjects, ignora o erro
-                pass
-        print(f"Gráficos encontrados no Excel: {list(charts_map.keys())}")
+        with zipfile.ZipFile(BytesIO(file_bytes)) as zf:
+            return "xl/workbook.xml" in zf.namelist()
+    except zipfile.BadZipFile:
+        return False
 
-        # Itera pelos slides para encontrar e substituir placeholders
-        for slide_idx, slide in enumerate(prs.slides):
-            # Usar list() para criar uma cópia, permitindo remover shapes durante a iteração
-            for shape in list(slide.shapes):
-                if not shape.has_text_frame:
-                    continue
-                
-                # Verifica se o texto do shape corresponde a algum placeholder de gráfico
-                for placeholder, chart_name in graficos_info.items():
-                    if placeholder in shape.text_frame.text:
-                        print(f"-> Placeholder '{placeholder}' encontrado no Slide {slide_idx + 1}.")
-                        
-                        if chart_name in charts_map:
-                            print(f"--> Gráfico '{chart_name}' correspondente encontrado no Excel.")
-                            
-                            # Exporta o gráfico para um arquivo temporário
-                            chart_object = charts_map[chart_name]
-                            with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp_file:
-                                image_path = tmp_file.name
-                            
-                            chart_object.Chart.Export(image_path)
-                            print(f"--> Gráfico exportado para: {image_path}")
-
-                            # Adiciona a imagem no lugar do placeholder
-                            left, top, width, height = shape.left, shape.top, shape.width, shape.height
-                            slide.shapes.add_picture(image_path, left, top, width=width, height=height)
-                            
-                            # Remove o shape do placeholder
-                            sp = shape._sp
-                            sp.getparent().remove(sp)
-                            print("--> Imagem inserida e placeholder removido.")
-                            
-                            os.remove(image_path)
-                        else:
-                            print(f"AVISO: O gráfico '{chart_name}' não foi encontrado no arquivo Excel. Verifique o nome.")
-                        # Sai do loop de placeholders, pois este shape já foi processado
-                        break
-                        
-    except Exception as e:
-        print(f"ERRO CRÍTICO na função substituir_graficos: {e}")
-        traceback.print_exc()
-    finally:
-        # Garante que o Excel seja fechado corretamente
-        if wb:
-            wb.Close(SaveChanges=False)
-        if excel:
-            excel.Quit()
-        pythoncom.CoUninitialize()
-        print("--- Finalizada a substituição de gráficos ---")
 
+def itens_lote(file_bytes):
+    """
+    Lista as propostas de um envio em lote: cada linha da aba Extract com
+    NOME_CLIENTE preenchido, se for um xlsx; ou a linha 2 de cada xlsx, se for um
+    .zip de planilhas.
+    """
+    if _eh_xlsx(file_bytes):
+        planilha = carregar_planilha_extract(file_bytes)
+        coluna_nome = TEXT_KEYS.index("NOME_CLIENTE") + 1
+        itens = []
+        for linha in range(2, planilha.max_row + 1):
+            nome_cliente = planilha.celula(linha, coluna_nome).value
+            if nome_cliente not in (None, ""):
+                itens.append(ItemLote(f"{linha:04d}_{_nome_arquivo_seguro(nome_cliente)}.pptx", file_bytes, linha))
+        return itens
 
-def adicionar_slides_customizados(prs, custom_slides_json):
-    try:
-        custom_slides_data = json.loads(custom_slides_json)
-        if not custom_slides_data:
-            return
+    itens = []
+    nomes = set()
+    descompactado = 0
+    with zipfile.ZipFile(BytesIO(file_bytes)) as zf:
+        for info in sorted(zf.infolist(), key=lambda info: info.filename):
+            base = posixpath.basename(info.filename)
+            if info.is_dir() or not base.lower().endswith(".xlsx") or base.startswith(("~$", "._")):
+                continue
+            # O tamanho declarado no zip é respeitado pelo zf.read, que para nele
+            descompactado += info.file_size
+            if descompactado > LOTE_DESCOMPACTADO_LIMITE_BYTES:
+                raise ArquivoGrandeDemais(f"As planilhas do .zip passam de "
+                                          f"{LOTE_DESCOMPACTADO_LIMITE_BYTES // (1024 * 1024)} MB descompactadas.")
+            nome = _nome_arquivo_seguro(posixpath.splitext(base)[0])
+            while nome in nomes:
+                nome += "_"
+            nomes.add(nome)
+            itens.append(ItemLote(f"{nome}.pptx", zf.read(info), 2))
+    return itens
 
-        template_slide_layout = prs.slides[-1].slide_layout
 
-        for slide_data in custom_slides_data:
-            slide_list = list(prs.slides)
-            target_idx = len(slide_list) - 1
-            
-            new_slide = prs.slides.add_slide(template_slide_layout)
+# Planilhas já interpretadas neste processo, para as várias linhas de um mesmo xlsx
+_planilhas_lote = OrderedDict()
 
-            title_text = slide_data.get('title', '')
-            content_text = slide_data.get('content', '')
 
-            if new_slide.shapes.title:
-                new_slide.shapes.title.text = title_text
-            
-            for shape in new_slide.shapes:
-                if shape.is_placeholder and shape.placeholder_format.type == 'BODY':
-                    shape.text_frame.text = content_text
-                    break
-            
-            sldIdLst = prs.part.package.part_related_by(prs.part.reltype).target_part.element.sldIdLst
-            slides = list(sldIdLst)
-            last_slide_id = slides[-1]
-            sldIdLst.remove(last_slide_id)
-            sldIdLst.insert(target_idx, last_slide_id)
+def _dados_planilha_lote(file_bytes):
+    chave = hashlib.sha1(file_bytes).hexdigest()
+    dados = _planilhas_lote.get(chave)
+    if dados is None:
+        dados = ler_dados_planilha(file_bytes)
+        _planilhas_lote[chave] = dados
+        while len(_planilhas_lote) > 4:
+            _planilhas_lote.popitem(last=False)
+    return dados
 
-    except Exception as e:
-        print(f"Erro ao adicionar slides customizados: {e}")
 
+def _iniciar_processo_lote(caminho_modelo):
+    global template_cache
+    if template_cache.caminho != caminho_modelo:
+        template_cache = CacheTemplate(caminho_modelo)
+    template_cache.versao_atual()
 
-def create_ppt(text_substitutions, table_data1, table_data2, campos_ativos, excel_path, slides_a_manter=None, logo_stream=None, custom_slides_json=None):
-    modelo_path = os.path.join(os.path.dirname(__file__), "templates_ppt", "modeloprincipal3.pptx")
-    prs = Presentation(modelo_path)
 
-    if custom_slides_json:
-        adicionar_slides_customizados(prs, custom_slides_json)
-
-    if slides_a_manter:
-        indices_a_manter = {s - 1 for s in slides_a_manter}
-        # Itera de trás para frente para remover slides sem afetar os índices dos slides restantes
-        for i in range(len(prs.slides) - 1, -1, -1):
-            if i not in indices_a_manter:
-                rId = prs.slides._sldIdLst[i].rId
-                prs.part.drop_rel(rId)
-                del prs.slides._sldIdLst[i]
-            
-    campos_ativos.extend([
-        "FABRICANTEMODULO", "MODELOMODULO", "POTENCIAMODULO",
-        "FABRICANTEINVERSORES", "MODELOINVERSORES", "POTENCIAINVERSORES",
-        "ESTRUTURA", "SISTEMAMONITORAMENTO",
-        "EQUIPAMENTOSESTRUTURA", "VIDAUTIL", "CERTIFICACAO", "ISOLANTE",
-        "CONTATO", "TENSAO", "PROTECAO", "TEMPOPERACAO",
-        "Manual1", "Manual2", "Manual3", "Manual4", "SOMATOTALFINAL",
-        "FLUXO1", "FLUXO2"
-    ])
+def _gerar_tarefa_lote(file_bytes, linhas, logo_bytes, itens_form):
+    """
+    Executada no processo do pool: gera as propostas das `linhas` de uma planilha.
+    Devolve [(linha, bytes do .pptx ou None, erro ou None, segundos)].
+    """
+    form = MultiDict(itens_form)
+    resultados = []
+    for linha in linhas:
+        inicio = time.perf_counter()
+        try:
+            planilha, table_data1, table_data2, graficos = _dados_planilha_lote(file_bytes)
+            text_subs = montar_substituicoes(planilha, form.to_dict(), linha)
+            prs = montar_apresentacao(
+                text_subs, table_data1, table_data2, form.getlist("campos"), file_bytes,
+                form.getlist("slides_a_manter", type=int),
+                logo_stream=BytesIO(logo_bytes) if logo_bytes else None,
+                custom_slides_json=form.get("custom_slides"), graficos=graficos,
+            )
+            buffer = BytesIO()
+            prs.save(buffer)
+            resultados.append((linha, buffer.getvalue(), None, time.perf_counter() - inicio))
+        except Exception as e:
+            traceback.print_exc()
+            resultados.append((linha, None, str(e), time.perf_counter() - inicio))
+    return resultados
 
-    substituir_textos(prs, text_substitutions, campos_ativos)
-    
-    if logo_stream:
-        substituir_logo(prs, logo_stream, '{{LOGOCLIENTE}}')
 
-    for slide in prs.slides:
-        substituir_tabela(slide, '{{FLUXO1}}', table_data1, campos_ativos)
-        substituir_tabela(slide, '{{FLUXO2}}', table_data2, campos_ativos)
+class _SaidaZip(io.RawIOBase):
+    """Destino não posicionável para o ZipFile; os bytes escritos são recolhidos por `coletar`."""
 
-    graficos_info = {
-        "{{grafico_receita}}": "ReceitaAnual",
-        "{{grafico_custos}}": "Custo"
-    }
-    substituir_graficos(prs, excel_path, graficos_info)
+    def __init__(self):
+        self._partes = []
 
-    buffer = BytesIO()
-    prs.save(buffer)
-    buffer.seek(0)
-    return buffer
+    def writable(self):
+        return True
 
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
 
-def pptx_to_pdf(pptx_path, output_dir):
+    def coletar(self):
+        dados = b"".join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def gerar_lote_zip(itens, logo_bytes, form, processos=LOTE_PROCESSOS):
+    """
+    Gera as propostas dos `itens` em um pool de processos e produz o .zip em partes,
+    à medida que cada tarefa termina. Cada processo interpreta o modelo uma única vez
+    (template_cache) e cada planilha uma única vez por tarefa de até
+    LOTE_LINHAS_POR_TAREFA linhas. O zip termina com relatorio.json (status e tempo
+    de cada proposta).
+    """
+    tarefas = []
+    por_planilha = OrderedDict()
+    for item in itens:
+        por_planilha.setdefault(id(item.planilha), []).append(item)
+    for grupo in por_planilha.values():
+        for i in range(0, len(grupo), LOTE_LINHAS_POR_TAREFA):
+            tarefas.append(grupo[i:i + LOTE_LINHAS_POR_TAREFA])
+
+    itens_form = list(form.items(multi=True))
+    saida = _SaidaZip()
+    relatorio = []
+    inicio = time.perf_counter()
+    processos = max(1, min(processos, len(tarefas)))
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=processos, mp_context=contexto_processos(),
+        initializer=_iniciar_processo_lote, initargs=(template_cache.caminho,),
+    )
     try:
-        subprocess.run(
-            [
-                LIBREOFFICE_PATH, "--headless", "--convert-to", "pdf",
-                "--outdir", output_dir, pptx_path
-            ],
-            check=True,
-            timeout=60
-        )
-        pdf_filename = os.path.basename(pptx_path).replace(".pptx", ".pdf")
-        return os.path.join(output_dir, pdf_filename)
-    except subprocess.TimeoutExpired:
-        raise RuntimeError("A conversão para PDF demorou demais (timeout).")
-    except Exception as e:
-        raise RuntimeError(f"Erro ao converter PPTX para PDF: {e}")
+        with zipfile.ZipFile(saida, "w", zipfile.ZIP_STORED) as zf:
+            futures = {
+                executor.submit(_gerar_tarefa_lote, tarefa[0].planilha, [item.linha for item in tarefa], logo_bytes, itens_form): tarefa
+                for tarefa in tarefas
+            }
+            for future in concurrent.futures.as_completed(futures):
+                for item, (_, pptx_bytes, erro, segundos) in zip(futures[future], future.result()):
+                    if pptx_bytes is not None:
+                        # .pptx já é comprimido; ZIP_STORED evita recomprimir
+                        zf.writestr(item.nome, pptx_bytes)
+                    relatorio.append({"arquivo": item.nome, "linha": item.linha, "erro": erro,
+                                      "segundos": round(segundos, 3)})
+                yield saida.coletar()
+            total = time.perf_counter() - inicio
+            zf.writestr("relatorio.json", json.dumps({
+                "propostas": len(itens),
+                "falhas": sum(1 for r in relatorio if r["erro"]),
+                "processos": processos,
+                "segundos": round(total, 3),
+                "itens": sorted(relatorio, key=lambda r: r["arquivo"]),
+            }, ensure_ascii=False, indent=2))
+        yield saida.coletar()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+# Vagas para lotes em andamento no /lote (cada lote ocupa a sua até o fim do streaming)
+lotes_em_andamento = threading.BoundedSemaphore(LOTE_SIMULTANEOS)
+
+
+# ===================================================================
+# SESSÕES DE PLANILHA
+# ===================================================================
+
+DadosPlanilha = namedtuple("DadosPlanilha", "planilha tabela1 tabela2 graficos")
+
+
+def ler_dados_planilha(file_bytes):
+    """Interpreta a planilha de uma vez: aba Extract, tabelas de fluxo e definições dos gráficos."""
+    planilha = carregar_planilha_extract(file_bytes)
+    return DadosPlanilha(
+        planilha,
+        build_table_data(planilha, INTERVALO_TABELA1),
+        build_table_data(planilha, INTERVALO_TABELA2),
+        carregar_graficos(file_bytes, set(GRAFICOS_INFO.values())),
+    )
+
+
+class SessaoExpirada(Gone):
+    """O token de planilha não existe mais (expirou ou foi removido por falta de memória)."""
+
+
+class SessaoPlanilha:
+    """
+    Planilha enviada uma vez e já interpretada. Tem a mesma interface de leitura de
+    ArquivoRecebido (`dados`, `como_bytes`), então os endpoints tratam as duas igualmente.
+    """
+
+    # Memória estimada por célula lida (CelulaExtract, chave e entrada no dict)
+    BYTES_POR_CELULA = 300
+
+    def __init__(self, token, conteudo, hash_conteudo, interpretada):
+        self.token = token
+        self.dados = conteudo
+        self.hash = hash_conteudo
+        self.interpretada = interpretada
+        self.tamanho = len(conteudo) + len(interpretada.planilha) * self.BYTES_POR_CELULA
+        self.ultimo_uso = time.monotonic()
+
+    def como_bytes(self):
+        return self.dados
+
+
+class SessoesPlanilha:
+    """
+    Sessões de planilha por token, com expiração após `ttl` segundos sem uso e
+    limite de memória estimada (as usadas há mais tempo saem primeiro). Planilhas
+    com o mesmo conteúdo compartilham a sessão.
+    """
+
+    def __init__(self, limite_bytes, ttl):
+        self.limite_bytes = limite_bytes
+        self.ttl = ttl
+        self.total_bytes = 0
+        self.criadas = 0
+        self.reaproveitadas = 0
+        self.expiradas = 0
+        self._sessoes = OrderedDict()
+        self._por_hash = {}
+        self._lock = threading.Lock()
+
+    def criar(self, conteudo):
+        """Sessão da planilha `conteudo` (bytes ou mmap), interpretando-a só se for nova."""
+        hash_conteudo = hashlib.sha256(conteudo).hexdigest()
+        with self._lock:
+            self._expirar()
+            token = self._por_hash.get(hash_conteudo)
+            if token is not None:
+                self.reaproveitadas += 1
+                return self._usar(token)
+        conteudo = conteudo if isinstance(conteudo, bytes) else bytes(conteudo)
+        sessao = SessaoPlanilha(uuid.uuid4().hex, conteudo, hash_conteudo, ler_dados_planilha(conteudo))
+        with self._lock:
+            if hash_conteudo in self._por_hash:
+                return self._usar(self._por_hash[hash_conteudo])
+            self.criadas += 1
+            if sessao.tamanho > self.limite_bytes:
+                return sessao  # maior que o limite: serve esta requisição, mas não é guardada
+            self._sessoes[sessao.token] = sessao
+            self._por_hash[hash_conteudo] = sessao.token
+            self.total_bytes += sessao.tamanho
+            while self.total_bytes > self.limite_bytes:
+                self._remover(next(iter(self._sessoes)))
+            return sessao
+
+    def obter(self, token):
+        with self._lock:
+            self._expirar()
+            if token not in self._sessoes:
+                return None
+            return self._usar(token)
+
+    def _usar(self, token):
+        sessao = self._sessoes[token]
+        sessao.ultimo_uso = time.monotonic()
+        self._sessoes.move_to_end(token)
+        return sessao
+
+    def _remover(self, token):
+        sessao = self._sessoes.pop(token)
+        del self._por_hash[sessao.hash]
+        self.total_bytes -= sessao.tamanho
+
+    def _expirar(self):
+        limite = time.monotonic() - self.ttl
+        while self._sessoes:
+            token, sessao = next(iter(self._sessoes.items()))
+            if sessao.ultimo_uso > limite:
+                break
+            self._remover(token)
+            self.expiradas += 1
+
+    def estatisticas(self):
+        return {"sessoes": len(self._sessoes), "bytes": self.total_bytes, "limite_bytes": self.limite_bytes,
+                "criadas": self.criadas, "reaproveitadas": self.reaproveitadas, "expiradas": self.expiradas}
+
+
+sessoes_planilha = SessoesPlanilha(SESSOES_PLANILHA_BYTES, SESSOES_PLANILHA_TTL)
+
+# ===================================================================
+# UPLOADS
+# ===================================================================
+
+class RequisicaoComSpool(Request):
+    """
+    Grava cada arquivo do multipart uma única vez, já no destino final: em memória
+    (BytesIO) nas requisições de até UPLOAD_MEMORIA_BYTES e num arquivo temporário no
+    DIRETORIO_TEMPORARIO nas maiores. O arquivo não tem nome e some ao ser fechado.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= UPLOAD_MEMORIA_BYTES:
+            return BytesIO()
+        return tempfile.TemporaryFile(dir=DIRETORIO_TEMPORARIO)
+
+
+app.request_class = RequisicaoComSpool
+app.config["MAX_CONTENT_LENGTH"] = UPLOAD_LIMITE_BYTES
+
+
+class ArquivoGrandeDemais(RequestEntityTooLarge):
+    """Um arquivo enviado passou do limite próprio (o da requisição é o MAX_CONTENT_LENGTH)."""
+
+
+class ArquivoRecebido:
+    """
+    Arquivo enviado, sem cópias: `dados` é o próprio conteúdo do upload (os bytes do
+    BytesIO, compartilhados, ou um mmap do arquivo temporário) e é o mesmo objeto
+    entregue à leitura da planilha, ao hash do cache e à montagem da apresentação.
+    O mmap é fechado ao sair do `with`.
+    """
+
+    # Mesma interface de SessaoPlanilha; um upload avulso não tem hash nem dados já interpretados
+    hash = None
+    interpretada = None
+
+    def __init__(self, storage, limite_bytes=UPLOAD_LIMITE_BYTES):
+        self.nome = storage.filename
+        stream = storage.stream
+        if isinstance(stream, BytesIO):
+            tamanho = stream.getbuffer().nbytes
+        else:
+            stream.flush()
+            tamanho = os.fstat(stream.fileno()).st_size
+        if tamanho > limite_bytes:
+            raise ArquivoGrandeDemais(f"O arquivo '{self.nome}' passa do limite de {limite_bytes // (1024 * 1024)} MB.")
+        if isinstance(stream, BytesIO):
+            self.dados = stream.getvalue()
+        elif tamanho:
+            self.dados = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.dados = b""
+
+    def como_bytes(self):
+        """Conteúdo como bytes, para enviar a outro processo (só copia quando está em mmap)."""
+        return bytes(self.dados) if isinstance(self.dados, mmap.mmap) else self.dados
+
+    def fechar(self):
+        if isinstance(self.dados, mmap.mmap):
+            try:
+                self.dados.close()
+            except BufferError:
+                pass  # ainda há leitores abertos; o mmap é liberado junto com eles
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+def sessao_da_requisicao():
+    """
+    Sessão indicada por `planilha_token` quando a requisição não traz o arquivo; None
+    se não houver token. SessaoExpirada (410) se o token não existir mais, para que o
+    cliente reenvie a planilha.
+    """
+    token = request.form.get("planilha_token")
+    if not token or "file" in request.files:
+        return None
+    sessao = sessoes_planilha.obter(token)
+    if sessao is None:
+        raise SessaoExpirada("A sessão da planilha expirou. Envie o arquivo novamente.")
+    return sessao
+
+
+@contextlib.contextmanager
+def arquivos_recebidos(sessao=None):
+    """
+    (planilha, logo ou None) da requisição atual, fechados ao final. A planilha é a
+    `sessao`, se informada, ou o arquivo enviado como ArquivoRecebido.
+    """
+    logo_storage = request.files.get("logo")
+    with contextlib.ExitStack() as pilha:
+        arquivo = sessao if sessao is not None else pilha.enter_context(ArquivoRecebido(request.files["file"]))
+        logo = pilha.enter_context(ArquivoRecebido(logo_storage, LOGO_LIMITE_BYTES)) if logo_storage else None
+        yield arquivo, logo
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_grande_demais(e):
+    descricao = e.description if isinstance(e, ArquivoGrandeDemais) else (
+        f"A requisição passa do limite de {app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} MB.")
+    return jsonify({"error": descricao}), 413
+
+
+@app.errorhandler(SessaoExpirada)
+def sessao_expirada(e):
+    return jsonify({"error": e.description}), 410
 
 # ===================================================================
 # ENDPOINTS
 # ===================================================================
 
+ID_REQUISICAO_VALIDO = re.compile(r"[A-Za-z0-9_.-]{1,64}")
+
+
+@app.before_request
+def iniciar_rastreamento():
+    g.inicio = time.perf_counter()
+    g.spans = []
+    # O id do cliente vai para o log e para o nome do arquivo de perfil; só é aceito se for seguro
+    requisicao_id = request.headers.get("X-Request-Id", "")
+    g.requisicao_id = requisicao_id if ID_REQUISICAO_VALIDO.fullmatch(requisicao_id) else uuid.uuid4().hex[:16]
+    g.perfil = None
+    tipo_perfil = request.headers.get("X-Perfil", "").lower()
+    if PERFIL_DIR and tipo_perfil:
+        if tipo_perfil == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+                g.perfil = ("pyinstrument", Profiler())
+            except ImportError:
+                print("AVISO: pyinstrument não instalado; usando cProfile.")
+        if g.perfil is None:
+            g.perfil = ("cprofile", cProfile.Profile())
+        tipo, perfil = g.perfil
+        if tipo == "cprofile":
+            perfil.enable()
+        else:
+            perfil.start()
+
+
+@app.after_request
+def registrar_rastreamento(response):
+    """
+    Cabeçalhos de rastreamento (o Server-Timing leva os spans até aqui). Duração, log
+    estruturado e perfil só são fechados quando a resposta termina de ser enviada,
+    para incluir o que um streaming (preview em NDJSON, lote) ainda faz depois daqui.
+    """
+    if "inicio" not in g:
+        return response
+    inicio, spans, requisicao_id, perfil = g.inicio, g.spans, g.requisicao_id, g.perfil
+    endpoint = request.url_rule.rule if request.url_rule else "desconhecido"
+    metodo = request.method
+    response.headers["X-Request-Id"] = requisicao_id
+    response.headers["Server-Timing"] = ", ".join(
+        f'{span["etapa"]};dur={span["duracao_ms"]}' for span in spans)
+    caminho_perfil = None
+    if perfil is not None:
+        extensao = ".prof" if perfil[0] == "cprofile" else ".html"
+        caminho_perfil = os.path.join(PERFIL_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{requisicao_id}{extensao}")
+        response.headers["X-Perfil-Arquivo"] = os.path.basename(caminho_perfil)
+
+    def finalizar():
+        duracao = time.perf_counter() - inicio
+        histograma_requisicoes.observar(duracao, endpoint, str(response.status_code))
+        if perfil is not None:
+            tipo, perfilador = perfil
+            os.makedirs(PERFIL_DIR, exist_ok=True)
+            if tipo == "cprofile":
+                perfilador.disable()
+                perfilador.dump_stats(caminho_perfil)
+            else:
+                perfilador.stop()
+                with open(caminho_perfil, "w", encoding="utf-8") as f:
+                    f.write(perfilador.output_html())
+        logger.info(json.dumps({
+            "requisicao_id": requisicao_id,
+            "metodo": metodo,
+            "endpoint": endpoint,
+            "status": response.status_code,
+            "duracao_ms": round(duracao * 1000, 2),
+            "spans": spans,
+        }, ensure_ascii=False))
+
+    response.call_on_close(finalizar)
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+def metricas():
+    """Métricas no formato texto do Prometheus: histogramas de etapas e requisições e os contadores internos."""
+    linhas = histograma_etapas.exportar() + histograma_requisicoes.exportar()
+    for prefixo, objeto in (("template_cache", template_cache), ("libreoffice", pool_libreoffice),
+                            ("cache_slides", cache_slides), ("cache_logos", cache_logos),
+                            ("cache_resultados", cache_resultados), ("sessoes_planilha", sessoes_planilha),
+                            ("jobs", gerenciador_jobs)):
+        linhas.extend(_metricas_de_estatisticas(prefixo, objeto.estatisticas()))
+    return Response("\n".join(linhas) + "\n", mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/extract", methods=["POST"])
 def extract_data():
     try:
         if "file" not in request.files:
             return jsonify({"error": "Nenhum arquivo enviado."}), 400
-        
-        file_bytes = request.files['file'].read()
 
-        wb_values = openpyxl.load_workbook(filename=BytesIO(file_bytes), data_only=True)
-        wb_formats = openpyxl.load_workbook(filename=BytesIO(file_bytes), data_only=False)
-        
-        ws_values = wb_values["Extract"]
-        ws_formats = wb_formats["Extract"]
-
-        row_cells_formats = ws_formats[2]
-        row_cells_values = ws_values[2]
+        # A planilha fica numa sessão: /preview e /generate podem mandar só o token
+        with ArquivoRecebido(request.files["file"]) as arquivo, medir_etapa("ingestao"):
+            sessao = sessoes_planilha.criar(arquivo.dados)
+        row_cells = sessao.interpretada.planilha.linha(2)
 
         def get_formatted_value(index):
-            if len(row_cells_formats) > index and len(row_cells_values) > index:
-                cell_with_format = row_cells_formats[index]
-                cell_with_value = row_cells_values[index]
-                
-                cell_with_format.value = cell_with_value.value
-                return format_cell(cell_with_format)
+            if len(row_cells) > index:
+                return format_cell(row_cells[index])
             return ""
 
         extracted_data = {
@@ -385,156 +3118,377 @@ def extract_data():
             "ICMS": get_formatted_value(14),
             "PONTA": get_formatted_value(15),
             "FORA_PONTA": get_formatted_value(16),
+            "planilha_token": sessao.token,
         }
         return jsonify(extracted_data)
 
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": f"Erro na extração: {e}"}), 500
 
 
+def montar_apresentacao_da_requisicao(file_bytes, logo_bytes, form, progresso=None, interpretada=None):
+    """`interpretada` (DadosPlanilha de uma sessão) dispensa reler a planilha e os gráficos."""
+    if progresso:
+        progresso("ingestao")
+    with medir_etapa("ingestao"):
+        if interpretada is None:
+            planilha = carregar_planilha_extract(file_bytes)
+            table_data1 = build_table_data(planilha, INTERVALO_TABELA1)
+            table_data2 = build_table_data(planilha, INTERVALO_TABELA2)
+            graficos = None
+        else:
+            planilha, table_data1, table_data2, graficos = interpretada
+        text_subs = montar_substituicoes(planilha, form.to_dict())
+
+    campos_ativos = form.getlist("campos")
+    slides_a_manter = form.getlist("slides_a_manter", type=int)
+    logo_stream = BytesIO(logo_bytes) if logo_bytes else None
+    custom_slides_json = form.get("custom_slides")
+
+    if progresso:
+        progresso("substituicao")
+    return montar_apresentacao(text_subs, table_data1, table_data2, campos_ativos, file_bytes, slides_a_manter, logo_stream=logo_stream, custom_slides_json=custom_slides_json, progresso=progresso, graficos=graficos)
+
+
 @app.route("/generate", methods=["POST"])
 def generate_ppt():
-    excel_path = None
     try:
-        if "file" not in request.files:
+        sessao = sessao_da_requisicao()
+        if sessao is None and "file" not in request.files:
             return jsonify({"error": "Nenhum arquivo enviado."}), 400
-            
-        file_bytes = request.files["file"].read()
-        logo_file = request.files.get("logo")
-        logo_stream = BytesIO(logo_file.read()) if logo_file else None
-        custom_slides_json = request.form.get("custom_slides")
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp_excel:
-            tmp_excel.write(file_bytes)
-            excel_path = tmp_excel.name
-
-        wb_values = openpyxl.load_workbook(filename=BytesIO(file_bytes), data_only=True)
-        wb_formats = openpyxl.load_workbook(filename=BytesIO(file_bytes), data_only=False)
-
-        ws_values_for_text = wb_values["Extract"]
-        row_values = [cell.value for cell in ws_values_for_text[2]]
-        
-        text_keys = [
-            "NOME_CLIENTE", "CONS_ENERGIA_MEDIO", "VOL_PROJ", "OBJ", "PRAZO_CONT",
-            "DESC_1ANO", "MODELO_NEGOCIO", "", "", "", "", "", "TAXA_MEDIA", "PIS",
-            "ICMS", "PONTA", "FORA_PONTA"
-        ]
-        text_subs = {
-            f"{{{{{key}}}}}": (str(row_values[idx]) if idx < len(row_values) and row_values[idx] is not None else "")
-            for idx, key in enumerate(text_keys) if key
-        }
-        
-        form_data = request.form.to_dict()
-        for key, value in form_data.items():
-            if key not in ["campos", "slides_a_manter", "custom_slides"]:
-                text_subs[f"{{{{{key}}}}}"] = value
-
-        ws_formats_for_table = wb_formats["Extract"]
-        ws_values_for_table = wb_values["Extract"]
-        table_data1 = build_table_data(ws_formats_for_table, ws_values_for_table, 'H2:L17')
-        table_data2 = build_table_data(ws_formats_for_table, ws_values_for_table, 'R2:V17')
-
-        campos_ativos = request.form.getlist("campos")
-        slides_a_manter = request.form.getlist("slides_a_manter", type=int)
-        
-        ppt_buffer = create_ppt(text_subs, table_data1, table_data2, campos_ativos, excel_path, slides_a_manter, logo_stream=logo_stream, custom_slides_json=custom_slides_json)
+
+        with arquivos_recebidos(sessao) as (arquivo, logo):
+            file_bytes = arquivo.dados
+            logo_bytes = logo.dados if logo else None
+            chave = chave_entrada(file_bytes, logo_bytes, request.form, arquivo.hash)
+            pptx_bytes = cache_resultados.obter(f"pptx-{chave}")
+            if pptx_bytes is None:
+                prs = montar_apresentacao_da_requisicao(file_bytes, logo_bytes, request.form,
+                                                        interpretada=arquivo.interpretada)
+                pptx_bytes = guardar_pptx(chave, prs)
 
         return send_file(
-            ppt_buffer,
+            BytesIO(pptx_bytes),
             as_attachment=True,
             download_name="proposta_customizada.pptx",
             mimetype="application/vnd.openxmlformats-officedocument.presentationml.presentation"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": f"Erro na geração: {e}"}), 500
-    finally:
-        if excel_path and os.path.exists(excel_path):
-            os.remove(excel_path)
 
 
 @app.route("/preview", methods=["POST"])
 def preview_ppt():
-    excel_path = None
-    pptx_temp_file = None
-    pdf_temp_file = None
-    
     try:
-        if "file" not in request.files:
+        sessao = sessao_da_requisicao()
+        if sessao is None and "file" not in request.files:
             return jsonify({"error": "Nenhum arquivo enviado."}), 400
-            
-        file_bytes = request.files["file"].read()
-        logo_file = request.files.get("logo")
-        logo_stream = BytesIO(logo_file.read()) if logo_file else None
-        custom_slides_json = request.form.get("custom_slides")
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp_excel:
-            tmp_excel.write(file_bytes)
-            excel_path = tmp_excel.name
-
-        wb_values = openpyxl.load_workbook(filename=BytesIO(file_bytes), data_only=True)
-        wb_formats = openpyxl.load_workbook(filename=BytesIO(file_bytes), data_only=False)
-
-        ws_values_for_text = wb_values["Extract"]
-        row_values = [cell.value for cell in ws_values_for_text[2]]
-
-        text_keys = [
-            "NOME_CLIENTE", "CONS_ENERGIA_MEDIO", "VOL_PROJ", "OBJ", "PRAZO_CONT",
-            "DESC_1ANO", "MODELO_NEGOCIO", "", "", "", "", "", "TAXA_MEDIA", "PIS",
-            "ICMS", "PONTA", "FORA_PONTA"
-        ]
-        text_subs = {
-            f"{{{{{key}}}}}": (str(row_values[idx]) if idx < len(row_values) and row_values[idx] is not None else "")
-            for idx, key in enumerate(text_keys) if key
-        }
-        
-        form_data = request.form.to_dict()
-        for key, value in form_data.items():
-            if key not in ["campos", "slides_a_manter", "custom_slides"]:
-                text_subs[f"{{{{{key}}}}}"] = value
-        
-        ws_formats_for_table = wb_formats["Extract"]
-        ws_values_for_table = wb_values["Extract"]
-        table_data1 = build_table_data(ws_formats_for_table, ws_values_for_table, 'H2:L17')
-        table_data2 = build_table_data(ws_formats_for_table, ws_values_for_table, 'R2:V17')
-        
-        campos_ativos = request.form.getlist("campos")
-        slides_a_manter = request.form.getlist("slides_a_manter", type=int)
-        
-        ppt_buffer = create_ppt(text_subs, table_data1, table_data2, campos_ativos, excel_path, slides_a_manter, logo_stream=logo_stream, custom_slides_json=custom_slides_json)
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pptx") as tmp_pptx:
-            tmp_pptx.write(ppt_buffer.getvalue())
-            pptx_temp_file = tmp_pptx.name
-            
-        output_dir = os.path.dirname(pptx_temp_file)
-        pdf_temp_file = pptx_to_pdf(pptx_temp_file, output_dir)
-        
-        images = convert_from_path(pdf_temp_file, poppler_path=POPPLER_PATH)
-        base64_images = []
-        
-        for img in images:
-            buffered = BytesIO()
-            img.save(buffered, format="PNG")
-            base64_images.append(base64.b64encode(buffered.getvalue()).decode("utf-8"))
 
-        return jsonify({"slides": base64_images})
+        slides_conhecidos = set(request.form.getlist("slides_conhecidos"))
+        dpi, formato = opcoes_preview(request.form)
+
+        # O deck só é montado (e o upload lido) antes da resposta começar; o streaming
+        # das imagens não depende mais dos arquivos enviados
+        with arquivos_recebidos(sessao) as (arquivo, logo):
+            file_bytes = arquivo.dados
+            logo_bytes = logo.dados if logo else None
+            chave = chave_entrada(file_bytes, logo_bytes, request.form, arquivo.hash)
+            chave_preview = f"preview-{chave}-{dpi}-{formato}"
+            prs = pptx_bytes = None
+            slides = cache_resultados.obter(chave_preview)
+            if slides is None:
+                prs = montar_apresentacao_da_requisicao(file_bytes, logo_bytes, request.form,
+                                                        interpretada=arquivo.interpretada)
+                # Um /generate logo depois do preview sai direto do cache
+                pptx_bytes = guardar_pptx(chave, prs)
+                slides = listar_slides_preview(prs, dpi, formato)
+                cache_resultados.guardar(chave_preview, json.dumps(slides).encode())
+            else:
+                slides = [tuple(slide) for slide in json.loads(slides)]
+            # `slide` pede um único slide (o "id" de um item), em geral em tamanho real para o modal
+            if request.form.get("slide"):
+                slides = [slide for slide in slides if f"slide-{slide[0]}" == request.form["slide"]]
+                if not slides:
+                    return jsonify({"error": "Slide não encontrado na apresentação."}), 404
+
+            def obter_prs():
+                if prs is not None:
+                    return prs
+                return montar_apresentacao_da_requisicao(file_bytes, logo_bytes, request.form,
+                                                         interpretada=arquivo.interpretada)
+
+            cabecalho, itens = preview_incremental(slides, obter_prs, slides_conhecidos, dpi, formato, pptx_bytes)
+        if request.form.get("stream") == "ndjson":
+            return Response(stream_with_context(stream_ndjson(cabecalho, itens)), mimetype="application/x-ndjson")
+        return jsonify(dict(cabecalho, slides=list(itens)))
+    except HTTPException:
+        raise
+    except FilaConversaoCheia as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": f"Erro no preview: {e}"}), 500
-    finally:
-        # Limpeza robusta de arquivos temporários
-        for temp_file in [pptx_temp_file, pdf_temp_file, excel_path]:
-            if temp_file and os.path.exists(temp_file):
-                try:
-                    os.remove(temp_file)
-                except Exception as e:
-                    print(f"Erro ao remover arquivo temporário {temp_file}: {e}")
+
+@app.route("/jobs", methods=["POST"])
+def criar_job():
+    """Enfileira um /generate (padrão) ou /preview (`tipo=preview`) e devolve o id do job."""
+    try:
+        sessao = sessao_da_requisicao()
+        if sessao is None and "file" not in request.files:
+            return jsonify({"error": "Nenhum arquivo enviado."}), 400
+        tipo = request.form.get("tipo", "generate")
+        if tipo not in ("generate", "preview"):
+            return jsonify({"error": f"Tipo de job inválido: {tipo}"}), 400
+
+        with arquivos_recebidos(sessao) as (arquivo, logo):
+            file_bytes = arquivo.como_bytes()
+            logo_bytes = logo.como_bytes() if logo else None
+        job = gerenciador_jobs.submeter(tipo, file_bytes, logo_bytes, request.form.copy())
+        return jsonify(job.resumo()), 202, {"Location": f"/jobs/{job.id}"}
+    except HTTPException:
+        raise
+    except FilaJobsCheia as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": f"Erro ao criar o job: {e}"}), 500
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def status_job(job_id):
+    job = gerenciador_jobs.obter(job_id)
+    if job is None:
+        return jsonify({"error": "Job não encontrado."}), 404
+    return jsonify(job.resumo())
+
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def cancelar_job(job_id):
+    job = gerenciador_jobs.cancelar(job_id)
+    if job is None:
+        return jsonify({"error": "Job não encontrado."}), 404
+    return jsonify(job.resumo())
+
+
+@app.route("/jobs/<job_id>/eventos", methods=["GET"])
+def eventos_job(job_id):
+    """Server-Sent Events com o resumo do job a cada mudança, até ele terminar."""
+    job = gerenciador_jobs.obter(job_id)
+    if job is None:
+        return jsonify({"error": "Job não encontrado."}), 404
+
+    def gerar():
+        versao = None
+        while True:
+            if versao == job.versao:
+                # Comentário SSE para manter a conexão viva enquanto nada muda
+                yield ": aguardando\n\n"
+            else:
+                versao = job.versao
+                resumo = job.resumo()
+                yield f"event: estado\ndata: {json.dumps(resumo)}\n\n"
+                if resumo["estado"] in ESTADOS_FINAIS:
+                    return
+            job.aguardar(versao, timeout=15)
+
+    return Response(stream_with_context(gerar()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/jobs/<job_id>/resultado", methods=["GET"])
+def resultado_job(job_id):
+    job = gerenciador_jobs.obter(job_id)
+    if job is None:
+        return jsonify({"error": "Job não encontrado."}), 404
+    if job.estado != "concluido":
+        return jsonify(dict(job.resumo(), error="O job ainda não foi concluído.")), 409
+    if job.tipo == "preview":
+        return jsonify(job.resultado)
+    return send_file(
+        BytesIO(job.resultado),
+        as_attachment=True,
+        download_name="proposta_customizada.pptx",
+        mimetype="application/vnd.openxmlformats-officedocument.presentationml.presentation"
+    )
+
+
+@app.route("/lote", methods=["POST"])
+def gerar_lote():
+    """
+    Gera uma proposta por linha da aba Extract (envio de um .xlsx) ou por planilha
+    (envio de um .zip de .xlsx) e devolve um .zip com as apresentações, em streaming.
+    Os demais campos do formulário valem para todas as propostas.
+    """
+    try:
+        if "file" not in request.files:
+            return jsonify({"error": "Nenhum arquivo enviado."}), 400
+        # As planilhas vão para os processos do pool, que recebem cópias de qualquer forma
+        with arquivos_recebidos() as (arquivo, logo):
+            file_bytes = arquivo.como_bytes()
+            logo_bytes = logo.como_bytes() if logo else None
+        try:
+            itens = itens_lote(file_bytes)
+        except (zipfile.BadZipFile, KeyError) as e:
+            return jsonify({"error": f"Arquivo de lote inválido: {e}"}), 400
+        if not itens:
+            return jsonify({"error": "Nenhuma proposta encontrada no arquivo enviado."}), 400
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": f"Erro no lote: {e}"}), 500
+    if not lotes_em_andamento.acquire(blocking=False):
+        return jsonify({"error": "Já há lotes demais em geração. Tente novamente em instantes."}), 503, {"Retry-After": "30"}
+
+    try:
+        resposta = Response(
+            stream_with_context(gerar_lote_zip(itens, logo_bytes, request.form.copy())),
+            mimetype="application/zip",
+            headers={"Content-Disposition": "attachment; filename=propostas.zip"},
+        )
+    except Exception:
+        lotes_em_andamento.release()
+        raise
+    resposta.call_on_close(lotes_em_andamento.release)
+    return resposta
+
+
+# ===================================================================
+# SERVIDOR DE PRODUÇÃO
+# ===================================================================
+
+def aquecer(preview=True):
+    """
+    Deixa o processo pronto para atender: carrega o modelo e o índice de placeholders e,
+    com `preview`, registra os formatos do PIL e importa o pdf2image, que no resto do
+    tempo só são carregados na primeira imagem ou pré-visualização. Chamada no mestre
+    antes do fork, o que ela carrega é compartilhado (copy-on-write) pelos workers.
+    """
+    inicio = time.perf_counter()
+    try:
+        template_cache.versao_atual()
+    except OSError as e:
+        print(f"AVISO: modelo não carregado no aquecimento ({e})")
+    if preview:
+        Image.init()
+        if motor_preview() != "uno":
+            import pdf2image  # noqa: F401
+    logger.info("aquecimento concluído em %.0f ms", (time.perf_counter() - inicio) * 1000)
+
+
+def apos_fork():
+    """
+    Executada em cada worker logo depois do fork. Os pools (LibreOffice, jobs) nascem
+    sob demanda dentro do próprio worker; as instâncias do LibreOffice de cada worker
+    escutam em portas livres para não colidirem com as dos vizinhos.
+    """
+    pool_libreoffice.usar_portas_livres()
+
+
+def servir(args):
+    """
+    Sobe o servidor de produção. Com o gunicorn instalado, o processo é substituído por
+    ele usando o gunicorn.conf.py (mestre aquecido, workers por fork, reciclagem após
+    SERVIDOR_MAX_REQUISICOES). Sem o gunicorn (Windows, por exemplo), serve num único
+    processo com threads, pelo waitress se disponível ou pelo servidor do Werkzeug.
+    """
+    os.environ.update(
+        SERVIDOR_ENDERECO=args.endereco,
+        SERVIDOR_PROCESSOS=str(args.processos),
+        SERVIDOR_THREADS=str(args.threads),
+        SERVIDOR_MAX_REQUISICOES=str(args.max_requisicoes),
+    )
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        diretorio = os.path.dirname(os.path.abspath(__file__))
+        sys.stdout.flush()
+        os.execv(sys.executable, [sys.executable, "-m", "gunicorn", "--chdir", diretorio,
+                                  "-c", os.path.join(diretorio, "gunicorn.conf.py"), "PPT:app"])
+
+    aquecer()
+    host, _, porta = args.endereco.rpartition(":")
+    host = host or "127.0.0.1"
+    print(f"gunicorn não instalado: servindo em {host}:{porta} num único processo com {args.threads} threads")
+    try:
+        from waitress import serve
+    except ImportError:
+        from werkzeug.serving import run_simple
+        run_simple(host, int(porta), app, threaded=True)
+    else:
+        serve(app, host=host, port=int(porta), threads=args.threads)
+
 
 # ===================================================================
 # MAIN
 # ===================================================================
 
+def executar_lote_cli(args):
+    with open(args.entrada, "rb") as f:
+        file_bytes = f.read()
+    logo_bytes = None
+    if args.logo:
+        with open(args.logo, "rb") as f:
+            logo_bytes = f.read()
+
+    form = MultiDict()
+    for campo in args.campo or CAMPOS_PADRAO_LOTE:
+        form.add("campos", campo)
+    for valor in args.valor:
+        chave, _, conteudo = valor.partition("=")
+        form.add(chave, conteudo)
+    for slide in args.manter_slide:
+        form.add("slides_a_manter", str(slide))
+
+    itens = itens_lote(file_bytes)
+    print(f"{len(itens)} propostas em {args.entrada}; gerando com {args.processos} processos...")
+    inicio = time.perf_counter()
+    with open(args.saida, "wb") as saida:
+        for parte in gerar_lote_zip(itens, logo_bytes, form, args.processos):
+            saida.write(parte)
+    total = time.perf_counter() - inicio
+    print(f"{args.saida}: {len(itens)} propostas em {total:.1f} s ({len(itens) / total * 60:.0f} por minuto)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor de propostas e geração em lote.")
+    subparsers = parser.add_subparsers(dest="comando")
+    lote = subparsers.add_parser("lote", help="Gera um .zip de propostas a partir de um .xlsx ou de um .zip de planilhas.")
+    lote.add_argument("entrada", help=".xlsx (uma proposta por linha da aba Extract) ou .zip de .xlsx")
+    lote.add_argument("-o", "--saida", default="propostas.zip")
+    lote.add_argument("--logo")
+    lote.add_argument("--processos", type=int, default=LOTE_PROCESSOS)
+    lote.add_argument("--campo", action="append", help="Campo ativo (repetível); padrão: os campos da planilha")
+    lote.add_argument("--valor", action="append", default=[], metavar="CHAVE=VALOR",
+                      help="Valor manual aplicado a todas as propostas (repetível)")
+    lote.add_argument("--manter-slide", action="append", type=int, default=[], metavar="N",
+                      help="Slide a manter (repetível); padrão: todos")
+    servidor = subparsers.add_parser("servir", help="Servidor de produção (gunicorn com workers pré-aquecidos, se instalado).")
+    servidor.add_argument("--endereco", default=SERVIDOR_ENDERECO, metavar="HOST:PORTA")
+    servidor.add_argument("--processos", type=int, default=SERVIDOR_PROCESSOS,
+                          help="Processos do gunicorn; acima de 1, exige afinidade de sessão no balanceador "
+                               "(jobs e sessões ficam na memória de cada processo)")
+    servidor.add_argument("--threads", type=int, default=SERVIDOR_THREADS)
+    servidor.add_argument("--max-requisicoes", type=int, default=SERVIDOR_MAX_REQUISICOES,
+                          help="Requisições por processo antes de reciclá-lo (0 = nunca)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.comando == "lote":
+        executar_lote_cli(args)
+    elif args.comando == "servir":
+        servir(args)
+    else:
+        app.run(debug=True, port=5000)
+
+
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,77 @@
+"""
+Benchmark da substituição de gráficos: leitura das definições do xlsx e desenho
+como gráfico nativo do PPTX (carregar_graficos + inserir_grafico). Quando o
+pywin32 e o Excel estão disponíveis (Windows), mede também a exportação via COM
+usada anteriormente (abrir o Excel, RefreshAll e Chart.Export para PNG).
+
+Uso: python benchmarks/bench_graficos.py [--repeticoes 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from pptx import Presentation
+from pptx.util import Inches
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import PPT  # noqa: E402
+from fixtures import NOMES_GRAFICOS, gerar_planilha, medir  # noqa: E402
+
+
+def caminho_nativo(file_bytes):
+    graficos = PPT.carregar_graficos(file_bytes, set(NOMES_GRAFICOS.values()))
+    prs = Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[6])
+    for definicao in graficos.values():
+        PPT.inserir_grafico(slide, definicao, Inches(1), Inches(1), Inches(4), Inches(3))
+
+
+def caminho_com(excel_path):
+    import pythoncom
+    import win32com.client as win32
+
+    pythoncom.CoInitialize()
+    excel = win32.gencache.EnsureDispatch("Excel.Application")
+    excel.Visible = False
+    excel.DisplayAlerts = False
+    wb = excel.Workbooks.Open(excel_path)
+    try:
+        wb.RefreshAll()
+        excel.CalculateUntilAsyncQueriesDone()
+        for chart_object in wb.Worksheets("Graficos").ChartObjects():
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp_file:
+                image_path = tmp_file.name
+            chart_object.Chart.Export(image_path)
+            os.remove(image_path)
+    finally:
+        wb.Close(SaveChanges=False)
+        excel.Quit()
+        pythoncom.CoUninitialize()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeticoes", type=int, default=20)
+    args = parser.parse_args()
+
+    file_bytes = gerar_planilha()
+    mediana_nativa = medir(lambda: caminho_nativo(file_bytes), args.repeticoes)
+    print(f"nativo: mediana {mediana_nativa * 1000:8.2f} ms")
+
+    try:
+        import win32com.client  # noqa: F401
+    except ImportError:
+        print("    COM: pywin32 indisponível, medição ignorada")
+        return
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp_excel:
+        tmp_excel.write(file_bytes)
+    try:
+        mediana_com = medir(lambda: caminho_com(tmp_excel.name), max(1, args.repeticoes // 5))
+    finally:
+        os.remove(tmp_excel.name)
+    print(f"    COM: mediana {mediana_com * 1000:8.2f} ms ({mediana_com / mediana_nativa:.0f}x mais lento)")
+
+
+if __name__ == "__main__":
+    main()
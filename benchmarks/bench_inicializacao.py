@@ -0,0 +1,96 @@
+"""
+Benchmark de inicialização: cada rodada sobe um interpretador novo e mede o import
+do PPT.py, o aquecimento (aquecer) e a latência da primeira requisição de cada
+endpoint, com e sem aquecimento prévio. O cenário "aquecido" é o que os workers do
+servidor de produção veem depois do fork a partir do mestre já aquecido.
+
+Uso: python benchmarks/bench_inicializacao.py [--repeticoes 5] [--slides 30]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ETAPAS = ("import", "aquecer", "primeiro_extract", "primeiro_generate")
+
+
+def medir_processo(planilha, aquecido):
+    """Roda dentro do processo novo; imprime os tempos (ms) de cada etapa em JSON."""
+    tempos = {}
+    inicio = time.perf_counter()
+    import PPT
+    tempos["import"] = (time.perf_counter() - inicio) * 1000
+    if aquecido:
+        inicio = time.perf_counter()
+        PPT.aquecer()
+        tempos["aquecer"] = (time.perf_counter() - inicio) * 1000
+
+    with open(planilha, "rb") as f:
+        file_bytes = f.read()
+    cliente = PPT.app.test_client()
+    inicio = time.perf_counter()
+    resposta = cliente.post("/extract", data={"file": (BytesIO(file_bytes), "planilha.xlsx")})
+    tempos["primeiro_extract"] = (time.perf_counter() - inicio) * 1000
+    assert resposta.status_code == 200, resposta.get_data(as_text=True)
+    modulos_preview = [nome for nome in ("pdf2image", "uno") if nome in sys.modules]
+
+    inicio = time.perf_counter()
+    resposta = cliente.post("/generate", data={
+        "planilha_token": resposta.get_json()["planilha_token"],
+        "campos": ["NOME_CLIENTE", "CONS_ENERGIA_MEDIO", "VOL_PROJ"],
+    })
+    tempos["primeiro_generate"] = (time.perf_counter() - inicio) * 1000
+    assert resposta.status_code == 200, resposta.get_data(as_text=True)
+    print(json.dumps({"tempos": tempos, "modulos_preview_apos_extract": modulos_preview}))
+
+
+def rodar(planilha, modelo, aquecido):
+    ambiente = dict(os.environ, MODELO_PATH=modelo)
+    comando = [sys.executable, os.path.abspath(__file__), "--filho", planilha]
+    if aquecido:
+        comando.append("--aquecido")
+    saida = subprocess.run(comando, env=ambiente, check=True, capture_output=True, text=True).stdout
+    return json.loads(saida.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--slides", type=int, default=30)
+    parser.add_argument("--filho", metavar="PLANILHA", help=argparse.SUPPRESS)
+    parser.add_argument("--aquecido", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.filho:
+        medir_processo(args.filho, args.aquecido)
+        return
+
+    import fixtures
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        modelo = os.path.join(tmp_dir, "modelo.pptx")
+        planilha = os.path.join(tmp_dir, "planilha.xlsx")
+        fixtures.gerar_modelo(modelo, args.slides)
+        with open(planilha, "wb") as f:
+            f.write(fixtures.gerar_planilha())
+
+        print(f"modelo com {args.slides} slides, mediana de {args.repeticoes} processos (ms)")
+        print(f"{'cenário':<10}" + "".join(f"{etapa:>19}" for etapa in ETAPAS) + f"{'total':>10}")
+        modulos = None
+        for aquecido in (False, True):
+            rodadas = [rodar(planilha, modelo, aquecido) for _ in range(args.repeticoes)]
+            modulos = modulos if aquecido else rodadas[0]["modulos_preview_apos_extract"]
+            medianas = {etapa: statistics.median(r["tempos"][etapa] for r in rodadas)
+                        for etapa in ETAPAS if etapa in rodadas[0]["tempos"]}
+            linha = "".join(f"{medianas[etapa]:19.1f}" if etapa in medianas else f"{'-':>19}" for etapa in ETAPAS)
+            print(f"{'aquecido' if aquecido else 'frio':<10}{linha}{sum(medianas.values()):10.1f}")
+        print(f"dependências do preview carregadas após o /extract (frio): {', '.join(modulos) or 'nenhuma'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Benchmark de vazão da geração em lote (gerar_lote_zip): propostas por minuto
+para cada quantidade de processos, a partir de uma planilha com uma proposta por
+linha da aba Extract.
+
+Uso: python benchmarks/bench_lote.py [--propostas 60] [--slides 30] [--processos 1,2,4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import PPT  # noqa: E402
+from fixtures import gerar_modelo, gerar_planilha  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--propostas", type=int, default=60)
+    parser.add_argument("--slides", type=int, default=30)
+    parser.add_argument("--processos", default=",".join(
+        str(n) for n in sorted({1, 2, 4, os.cpu_count() or 1}) if n <= (os.cpu_count() or 1)))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        caminho = os.path.join(tmp_dir, "modelo.pptx")
+        gerar_modelo(caminho, args.slides)
+        PPT.template_cache = PPT.CacheTemplate(caminho)
+        file_bytes = gerar_planilha(propostas=args.propostas)
+        itens = PPT.itens_lote(file_bytes)
+        form = PPT.MultiDict([("campos", campo) for campo in PPT.CAMPOS_PADRAO_LOTE])
+        print(f"{len(itens)} propostas, modelo com {args.slides} slides, {os.cpu_count()} CPUs")
+
+        base = None
+        for processos in (int(n) for n in args.processos.split(",")):
+            inicio = time.perf_counter()
+            saida = BytesIO()
+            for parte in PPT.gerar_lote_zip(itens, None, form, processos):
+                saida.write(parte)
+            total = time.perf_counter() - inicio
+            with zipfile.ZipFile(saida) as zf:
+                assert len(zf.namelist()) == len(itens) + 1
+            por_minuto = len(itens) / total * 60
+            base = base or por_minuto
+            print(f"{processos:>3} processos: {total:6.2f} s | {por_minuto:7.0f} propostas/min | "
+                  f"{por_minuto / base:4.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark da leitura da aba "Extract": caminho antigo (dois load_workbook +
+build_table_data sobre células do openpyxl) contra carregar_planilha_extract.
+
+Uso: python benchmarks/bench_planilha.py [--linhas 20000] [--repeticoes 5]
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+from io import BytesIO
+
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import PPT  # noqa: E402
+from fixtures import gerar_planilha, medir  # noqa: E402
+
+
+def caminho_antigo(file_bytes):
+    wb_values = openpyxl.load_workbook(filename=BytesIO(file_bytes), data_only=True)
+    wb_formats = openpyxl.load_workbook(filename=BytesIO(file_bytes), data_only=False)
+    ws_values, ws_formats = wb_values["Extract"], wb_formats["Extract"]
+    tabelas = []
+    for range_string in (PPT.INTERVALO_TABELA1, PPT.INTERVALO_TABELA2):
+        table_data = []
+        for row_format, row_value in zip(ws_formats[range_string], ws_values[range_string]):
+            new_row = []
+            for cell_format, cell_value in zip(row_format, row_value):
+                cell_format.value = cell_value.value
+                new_row.append(PPT.format_cell(cell_format))
+            table_data.append(new_row)
+        tabelas.append(table_data)
+    return tabelas
+
+
+def caminho_novo(file_bytes):
+    planilha = PPT.carregar_planilha_extract(file_bytes)
+    return [PPT.build_table_data(planilha, PPT.INTERVALO_TABELA1),
+            PPT.build_table_data(planilha, PPT.INTERVALO_TABELA2)]
+
+
+def pico_memoria(funcao, file_bytes):
+    tracemalloc.start()
+    funcao(file_bytes)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--linhas", type=int, default=20000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    file_bytes = gerar_planilha(args.linhas)
+    assert caminho_antigo(file_bytes) == caminho_novo(file_bytes)
+    print(f"Planilha sintética: {len(file_bytes) / 1e6:.1f} MB")
+
+    for nome, funcao in (("antigo", caminho_antigo), ("novo", caminho_novo)):
+        mediana = medir(lambda: funcao(file_bytes), args.repeticoes)
+        pico = pico_memoria(funcao, file_bytes)
+        print(f"{nome:>7}: mediana {mediana * 1000:8.1f} ms | pico de memória {pico / 1e6:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
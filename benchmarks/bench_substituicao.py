@@ -0,0 +1,79 @@
+"""
+Micro-benchmark de substituir_textos: algoritmo antigo (todas as chaves contra
+todos os parágrafos de todos os shapes, com str.replace repetido) contra o
+MotorSubstituicao compilado, despachado pelo índice de placeholders.
+
+Uso: python benchmarks/bench_substituicao.py [--slides 30] [--chaves 120] [--repeticoes 10]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import PPT  # noqa: E402
+from fixtures import gerar_modelo, medir  # noqa: E402
+
+
+def substituir_textos_antigo(prs, substituicoes, campos_ativos):
+    """Cópia do algoritmo anterior (sem o copiar da fonte do primeiro run)."""
+    for slide in prs.slides:
+        for shape in slide.shapes:
+            if not shape.has_text_frame or shape.has_table:
+                continue
+            for paragraph in shape.text_frame.paragraphs:
+                full_text = ''.join(run.text for run in paragraph.runs)
+                original_text = full_text
+                for chave, valor in substituicoes.items():
+                    if chave.strip('{} ') in campos_ativos and chave in full_text:
+                        full_text = full_text.replace(chave, str(valor) if valor is not None else "")
+                placeholders_inativos = {chave for chave in substituicoes if chave.strip('{} ') not in campos_ativos}
+                for chave_inativa in placeholders_inativos:
+                    if chave_inativa in full_text:
+                        full_text = full_text.replace(chave_inativa, "")
+                if original_text != full_text:
+                    for _ in range(len(paragraph.runs)):
+                        r = paragraph.runs[0]._r
+                        r.getparent().remove(r)
+                    paragraph.add_run().text = full_text
+
+
+def textos(prs):
+    return [p.text for slide in prs.slides for shape in slide.shapes if shape.has_text_frame
+            for p in shape.text_frame.paragraphs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--slides", type=int, default=30)
+    parser.add_argument("--chaves", type=int, default=120)
+    parser.add_argument("--repeticoes", type=int, default=10)
+    args = parser.parse_args()
+
+    chaves = [f"CAMPO_{i:03d}" for i in range(args.chaves)]
+    substituicoes = {f"{{{{{chave}}}}}": f"valor {i}" for i, chave in enumerate(chaves)}
+    campos_ativos = chaves[::2]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        caminho = os.path.join(tmp_dir, "modelo.pptx")
+        gerar_modelo(caminho, args.slides, chaves=chaves)
+        cache = PPT.CacheTemplate(caminho)
+
+        antigo, _ = cache.obter()
+        substituir_textos_antigo(antigo, substituicoes, campos_ativos)
+        novo, indice = cache.obter()
+        PPT.substituir_textos(novo, substituicoes, campos_ativos, indice)
+        assert textos(antigo) == textos(novo)
+
+        mediana_antiga = medir(lambda estado: substituir_textos_antigo(estado[0], substituicoes, campos_ativos),
+                               args.repeticoes, cache.obter)
+        mediana_nova = medir(lambda estado: PPT.substituir_textos(estado[0], substituicoes, campos_ativos, estado[1]),
+                             args.repeticoes, cache.obter)
+
+    print(f"{args.slides} slides, {len(substituicoes)} chaves ({len(campos_ativos)} ativas)")
+    print(f"antigo: mediana {mediana_antiga * 1000:8.2f} ms")
+    print(f"  novo: mediana {mediana_nova * 1000:8.2f} ms ({mediana_antiga / mediana_nova:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Benchmark do carregamento do modelo por requisição: Presentation(caminho)
+contra CacheTemplate.obter() (modelo e índice de placeholders interpretados
+uma vez e copiados).
+
+Uso: python benchmarks/bench_template.py [--slides 30] [--repeticoes 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+from io import BytesIO
+
+from pptx import Presentation
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import PPT  # noqa: E402
+from fixtures import gerar_modelo, medir  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--slides", type=int, default=30)
+    parser.add_argument("--repeticoes", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        caminho = os.path.join(tmp_dir, "modelo.pptx")
+        gerar_modelo(caminho, args.slides)
+        cache = PPT.CacheTemplate(caminho)
+        cache.obter()  # aquecimento: primeira carga (miss)
+
+        def salvar(prs):
+            prs.save(BytesIO())
+
+        resultados = {
+            "Presentation(caminho)": medir(lambda: Presentation(caminho), args.repeticoes),
+            "cache.obter()": medir(cache.obter, args.repeticoes),
+            "Presentation(caminho) + save": medir(lambda: salvar(Presentation(caminho)), args.repeticoes),
+            "cache.obter() + save": medir(lambda: salvar(cache.obter()[0]), args.repeticoes),
+        }
+        for nome, mediana in resultados.items():
+            print(f"{nome:>30}: mediana {mediana * 1000:7.2f} ms")
+        print(f"Contadores do cache: {cache.estatisticas()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Fixtures sintéticas dos benchmarks: planilhas com a aba Extract em vários tamanhos
+(tabelas de fluxo e gráficos ReceitaAnual/Custo incluídos), modelos .pptx com N
+slides e M placeholders por slide e logos em várias resoluções. A geração usa
+semente fixa, então rodadas diferentes medem exatamente as mesmas entradas.
+Inclui também `medir`, a mediana de tempo usada pelos benchmarks avulsos.
+"""
+import os
+import random
+import statistics
+import sys
+import time
+import zipfile
+from io import BytesIO
+
+import openpyxl
+from openpyxl.chart import BarChart, LineChart, Reference
+from PIL import Image
+from pptx import Presentation
+from pptx.util import Inches
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import PPT  # noqa: E402
+
+# Linhas extras na aba "Dados", só para aumentar o tamanho do xlsx
+TAMANHOS_PLANILHA = {"pequena": 0, "media": 5000, "grande": 50000}
+RESOLUCOES_LOGO = {"pequeno": (200, 80), "medio": (1200, 480), "grande": (4000, 1600)}
+
+CHAVES_TEXTO = [key for key in PPT.TEXT_KEYS if key] + [
+    "Manual1", "Manual2", "Manual3", "Manual4", "SOMATOTALFINAL",
+    "FABRICANTEMODULO", "MODELOMODULO", "POTENCIAMODULO", "ESTRUTURA", "VIDAUTIL",
+]
+NOMES_GRAFICOS = {"Chart 1": "ReceitaAnual", "Chart 2": "Custo"}
+# Linhas (cabeçalho incluído) da tabela longa, que ocupa vários slides
+LINHAS_TABELA_LONGA = 60
+
+
+def gerar_planilha(linhas_extras=0, propostas=1, semente=42, linhas_tabela=16):
+    """
+    xlsx com Extract (uma proposta por linha a partir da 2), tabelas em H:L e R:V a
+    partir da linha 2 (H2:L17 e R2:V17 com as 16 linhas padrão) e os dois gráficos.
+    """
+    aleatorio = random.Random(semente)
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Extract"
+    ws.append([f"COL{i}" for i in range(1, 23)])
+    for linha in range(2, propostas + 2):
+        valores = [f"Cliente {linha - 1}", 12345.67 + linha, 0.15, "Objetivo", 10, 0.2, "Modelo",
+                   None, None, None, None, None, 1500.5, 0.0165, 0.18, 0.9, 0.5]
+        for coluna, valor in enumerate(valores, start=1):
+            if valor is not None:
+                ws.cell(linha, coluna, valor)
+        for coluna, formato in ((3, "0.00%"), (6, "0.00%"), (13, '"R$" #,##0.00')):
+            ws.cell(linha, coluna).number_format = formato
+    for primeira_coluna in (8, 18):
+        for linha in range(2, linhas_tabela + 2):
+            for offset in range(5):
+                celula = ws.cell(linha, primeira_coluna + offset, aleatorio.random() * 1e5)
+                celula.number_format = '"R$" #,##0.00' if offset % 2 else "0.00%"
+
+    graficos = wb.create_sheet("Graficos")
+    for ano in range(1, 26):
+        graficos.append([f"Ano {ano}", ano * 1000.0, ano * 350.0])
+    categorias = Reference(graficos, min_col=1, min_row=1, max_row=25)
+    for grafico, coluna, ancora in ((BarChart(), 2, "E2"), (LineChart(), 3, "E20")):
+        grafico.add_data(Reference(graficos, min_col=coluna, min_row=1, max_row=25))
+        grafico.set_categories(categorias)
+        graficos.add_chart(grafico, ancora)
+
+    dados = wb.create_sheet("Dados")
+    for linha in range(linhas_extras):
+        dados.append([aleatorio.random() if col % 3 else f"texto {linha}-{col}" for col in range(15)])
+    buffer = BytesIO()
+    wb.save(buffer)
+
+    # O openpyxl sempre nomeia os gráficos como "Chart N"; renomeia no XML do desenho
+    entrada = zipfile.ZipFile(BytesIO(buffer.getvalue()))
+    saida_buffer = BytesIO()
+    with zipfile.ZipFile(saida_buffer, "w", zipfile.ZIP_DEFLATED) as saida:
+        for item in entrada.infolist():
+            conteudo = entrada.read(item.filename)
+            if item.filename.startswith("xl/drawings/drawing"):
+                for antigo, novo in NOMES_GRAFICOS.items():
+                    conteudo = conteudo.replace(f'name="{antigo}"'.encode(), f'name="{novo}"'.encode())
+            saida.writestr(item, conteudo)
+    return saida_buffer.getvalue()
+
+
+def gerar_modelo(caminho, num_slides=30, placeholders_por_slide=8, semente=42, chaves=None):
+    """
+    Modelo com título e uma caixa de `placeholders_por_slide` parágrafos por slide
+    (parte deles com o placeholder dividido em dois runs), uma imagem a cada três
+    slides e os placeholders especiais: logo no slide 2, tabelas nos slides 3 e 4
+    e gráficos nos slides 5 e 6. Os placeholders dos parágrafos são sorteados de
+    `chaves` (padrão: as chaves de texto da planilha e os campos manuais).
+    """
+    chaves = chaves or CHAVES_TEXTO
+    aleatorio = random.Random(semente)
+    especiais = {2: "{{LOGOCLIENTE}}", 3: "{{FLUXO1}}", 4: "{{FLUXO2}}",
+                 5: "{{grafico_receita}}", 6: "{{grafico_custos}}"}
+    prs = Presentation()
+    for numero in range(1, num_slides + 1):
+        slide = prs.slides.add_slide(prs.slide_layouts[5])
+        slide.shapes.title.text = f"Slide {numero} - {{{{NOME_CLIENTE}}}}"
+        tf = slide.shapes.add_textbox(Inches(0.5), Inches(1.5), Inches(5), Inches(5)).text_frame
+        tf.text = "Texto fixo sem placeholders."
+        for chave in aleatorio.sample(chaves, min(placeholders_por_slide, len(chaves))):
+            paragraph = tf.add_paragraph()
+            if aleatorio.random() < 0.3:
+                meio = len(chave) // 2
+                paragraph.add_run().text = f"{chave.title()}: {{{{{chave[:meio]}"
+                paragraph.add_run().text = f"{chave[meio:]}}}}}"
+            else:
+                paragraph.add_run().text = f"{chave.title()}: {{{{{chave}}}}}"
+        if numero in especiais:
+            slide.shapes.add_textbox(Inches(6), Inches(1.5), Inches(3.5), Inches(3)).text_frame.text = especiais[numero]
+        elif numero % 3 == 0:
+            imagem = BytesIO()
+            Image.new("RGB", (800, 450), (numero * 8 % 256, 120, 200)).save(imagem, format="PNG")
+            imagem.seek(0)
+            slide.shapes.add_picture(imagem, Inches(6), Inches(4), Inches(3), Inches(2))
+    prs.save(caminho)
+
+
+def gerar_logo(largura, altura, formato="PNG"):
+    """Logo com gradiente (não comprime trivialmente, como uma imagem real)."""
+    imagem = Image.linear_gradient("L").resize((largura, altura)).convert("RGB")
+    buffer = BytesIO()
+    imagem.save(buffer, format=formato)
+    return buffer.getvalue()
+
+
+def medir(funcao, repeticoes, preparar=None):
+    """
+    Mediana, em segundos, de `repeticoes` chamadas de funcao(). Com `preparar`, cada
+    chamada é funcao(preparar()), com o preparo fora da medição.
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        argumentos = (preparar(),) if preparar else ()
+        inicio = time.perf_counter()
+        funcao(*argumentos)
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos)
+
+
+def formulario_padrao():
+    """Campos marcados e valores manuais como a interface envia por padrão."""
+    substituicoes = {f"{{{{Manual{i}}}}}": f"{i} dias" for i in range(1, 5)}
+    campos = PPT.CAMPOS_PADRAO_LOTE + ["Manual1", "Manual2"]
+    return substituicoes, campos
@@ -0,0 +1,361 @@
+"""
+Suíte de benchmarks do pipeline do PPT.py sobre as fixtures sintéticas: latência
+por função e ponta a ponta, pico de RSS e vazão. Cada caso roda num processo
+próprio, para que o pico de RSS seja só dele. Os resultados podem ser gravados
+como baseline em JSON e comparados depois, falhando (código de saída 1) quando
+algum caso piora além do limite.
+
+Sem LibreOffice/poppler instalados (ou com --substitutos), a conversão para PDF e
+a rasterização usam substitutos em Python: o PDF é gerado pelo Pillow com uma
+página por slide e as páginas "rasterizadas" são imagens em branco do tamanho
+certo. Assim a suíte roda em qualquer Linux sem Office.
+
+Uso:
+  python benchmarks/suite.py [--repeticoes 10] [--casos create_ppt,preview]
+  python benchmarks/suite.py --salvar-baseline benchmarks/baseline.json
+  python benchmarks/suite.py --baseline benchmarks/baseline.json [--limite 0.15]
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from collections import namedtuple
+from io import BytesIO
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import PPT  # noqa: E402
+import fixtures  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# preparar(contexto) -> argumento (fora da medição); executar(argumento) é medido.
+# `unidades` é quanto trabalho uma execução representa, para a vazão.
+Caso = namedtuple("Caso", ["preparar", "executar", "unidades"])
+
+
+def _ler_planilha(file_bytes):
+    return PPT.carregar_planilha_extract(file_bytes)
+
+
+def _celulas_formatadas(contexto):
+    planilha = PPT.carregar_planilha_extract(contexto["planilhas"]["pequena"])
+    celulas = list(planilha.linha(2))
+    for intervalo in (PPT.INTERVALO_TABELA1, PPT.INTERVALO_TABELA2):
+        for linha in planilha.intervalo(intervalo):
+            celulas.extend(linha)
+    return celulas
+
+
+def _dados_proposta(contexto, logo=None):
+    planilha = PPT.carregar_planilha_extract(contexto["planilhas"]["pequena"])
+    substituicoes, campos = fixtures.formulario_padrao()
+    substituicoes.update(PPT.montar_substituicoes(planilha, {}))
+    return {
+        "substituicoes": substituicoes,
+        "campos": campos,
+        "tabela1": PPT.build_table_data(planilha, PPT.INTERVALO_TABELA1),
+        "tabela2": PPT.build_table_data(planilha, PPT.INTERVALO_TABELA2),
+        "planilha": contexto["planilhas"]["pequena"],
+        "logo": contexto["logos"][logo] if logo else None,
+    }
+
+
+def _create_ppt(dados):
+    logo = BytesIO(dados["logo"]) if dados["logo"] else None
+    return PPT.create_ppt(dict(dados["substituicoes"]), dados["tabela1"], dados["tabela2"],
+                          list(dados["campos"]), dados["planilha"], dados.get("slides_a_manter"), logo_stream=logo)
+
+
+def _dados_selecao(contexto):
+    """Proposta com só 5 slides do modelo mantidos (nenhum deles com gráfico)."""
+    return dict(_dados_proposta(contexto), slides_a_manter=[1, 2, 3, 10, 20])
+
+
+def _preparar_preview(contexto):
+    dados = _dados_proposta(contexto)
+    PPT.cache_slides = PPT.CacheLRU(PPT.PREVIEW_CACHE_BYTES)  # sempre renderiza tudo
+
+    def montar():
+        return PPT.montar_apresentacao(dict(dados["substituicoes"]), dados["tabela1"], dados["tabela2"],
+                                       list(dados["campos"]), dados["planilha"])
+    return montar
+
+
+def _preview(montar):
+    PPT.cache_slides = PPT.CacheLRU(PPT.PREVIEW_CACHE_BYTES)
+    prs = montar()
+    slides = PPT.listar_slides_preview(prs)
+    _, itens = PPT.preview_incremental(slides, lambda: prs, set())
+    for _ in itens:
+        pass
+
+
+def _preparar_textos(contexto):
+    dados = _dados_proposta(contexto)
+    return dados, PPT.template_cache.obter()
+
+
+def _preparar_slides_customizados(contexto):
+    prs = PPT.template_cache.obter()[0]
+    slides = [{"title": f"Extra {i}", "content": "Conteúdo " * 20} for i in range(5)]
+    return prs, json.dumps(slides), len(prs.slides) + len(slides)
+
+
+def _preparar_tabela_longa(contexto):
+    """Tabela {{FLUXO1}} com LINHAS_TABELA_LONGA linhas, lida com intervalo aberto e paginada."""
+    planilha = PPT.carregar_planilha_extract(contexto["tabela_longa"])
+    tabela = PPT.build_table_data(planilha, "H2:L")
+    assert len(tabela) == fixtures.LINHAS_TABELA_LONGA, len(tabela)
+    _, campos = fixtures.formulario_padrao()
+    prs, indice = PPT.template_cache.obter()
+    por_pagina = PPT.TABELA_LINHAS_POR_SLIDE - 1
+    continuacoes = -(-(len(tabela) - 1) // por_pagina) - 1
+    slides_com_tabela = len({slide.slide_id for slide, _ in indice.shapes(prs, "{{FLUXO1}}", ignorar_caixa=True)})
+    return prs, indice, tabela, campos, len(prs.slides) + continuacoes * slides_com_tabela
+
+
+def _substituir_tabela_longa(estado):
+    prs, indice, tabela, campos, total_esperado = estado
+    PPT.substituir_tabela(prs, "{{FLUXO1}}", tabela, campos, indice)
+    assert len(prs.slides) == total_esperado, (len(prs.slides), total_esperado)
+
+
+def _adicionar_slides_customizados(estado):
+    prs, custom_slides_json, total_esperado = estado
+    PPT.adicionar_slides_customizados(prs, custom_slides_json, PPT.template_cache.ultimo_slide)
+    assert len(prs.slides) == total_esperado, (len(prs.slides), total_esperado)
+
+
+CASOS = {
+    "format_cell": Caso(_celulas_formatadas, lambda celulas: [PPT.format_cell(c) for c in celulas], 160),
+    "build_table_data": Caso(
+        lambda contexto: PPT.carregar_planilha_extract(contexto["planilhas"]["pequena"]),
+        lambda planilha: (PPT.build_table_data(planilha, PPT.INTERVALO_TABELA1),
+                          PPT.build_table_data(planilha, PPT.INTERVALO_TABELA2)), 2),
+    "template_cache.obter": Caso(lambda contexto: None, lambda _: PPT.template_cache.obter(), 1),
+    "substituir_textos": Caso(
+        _preparar_textos,
+        lambda estado: PPT.substituir_textos(estado[1][0], estado[0]["substituicoes"], estado[0]["campos"], estado[1][1]),
+        1),
+    "substituir_tabela": Caso(
+        _preparar_textos,
+        lambda estado: PPT.substituir_tabela(estado[1][0], "{{FLUXO1}}", estado[0]["tabela1"], estado[0]["campos"], estado[1][1]),
+        1),
+    "substituir_tabela[paginada]": Caso(_preparar_tabela_longa, _substituir_tabela_longa, 1),
+    "adicionar_slides_customizados": Caso(_preparar_slides_customizados, _adicionar_slides_customizados, 5),
+    "create_ppt": Caso(_dados_proposta, _create_ppt, 1),
+    "create_ppt[logo_grande]": Caso(lambda contexto: _dados_proposta(contexto, "grande"), _create_ppt, 1),
+    "create_ppt[5_slides]": Caso(_dados_selecao, _create_ppt, 1),
+    "preview": Caso(_preparar_preview, _preview, 1),
+}
+for _tamanho in fixtures.TAMANHOS_PLANILHA:
+    CASOS[f"carregar_planilha[{_tamanho}]"] = Caso(
+        lambda contexto, tamanho=_tamanho: contexto["planilhas"][tamanho], _ler_planilha, 1)
+
+# Casos cujo preparar() muda o estado que executar() consome: preparam a cada repetição
+PREPARAR_A_CADA_REPETICAO = {"substituir_textos", "substituir_tabela", "substituir_tabela[paginada]",
+                             "adicionar_slides_customizados"}
+
+
+def instalar_substitutos():
+    """Troca pptx_to_pdf e a rasterização do poppler por equivalentes em Python."""
+    paginas_por_pdf = {}
+
+    def pptx_to_pdf(pptx_path, output_dir):
+        with zipfile.ZipFile(pptx_path) as zf:
+            paginas = sum(1 for nome in zf.namelist() if re.fullmatch(r"ppt/slides/slide\d+\.xml", nome))
+        pdf_path = os.path.join(output_dir, os.path.splitext(os.path.basename(pptx_path))[0] + ".pdf")
+        imagens = [Image.new("RGB", (320, 180), "white") for _ in range(max(paginas, 1))]
+        imagens[0].save(pdf_path, format="PDF", save_all=True, append_images=imagens[1:])
+        paginas_por_pdf[pdf_path] = paginas
+        return pdf_path
+
+    def pdfinfo_from_path(pdf_path, poppler_path=None):
+        return {"Pages": paginas_por_pdf[pdf_path]}
+
+    def convert_from_path(pdf_path, dpi=200, first_page=None, last_page=None, poppler_path=None):
+        # Slide 16:9 de 13,33 x 7,5 polegadas
+        return [Image.new("RGB", (int(13.333 * dpi), int(7.5 * dpi)), "white")
+                for _ in range((last_page or 1) - (first_page or 1) + 1)]
+
+    PPT.pptx_to_pdf = pptx_to_pdf
+    PPT.pdfinfo_from_path = pdfinfo_from_path
+    PPT.convert_from_path = convert_from_path
+
+
+def pico_rss_mb():
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def gerar_fixtures(diretorio, slides, placeholders):
+    """
+    Grava modelo, planilhas e logos sintéticos em `diretorio`. Roda num processo
+    próprio: no Linux o pico de RSS passa do pai para os filhos, e a planilha grande
+    ocupa centenas de MB enquanto é gerada.
+    """
+    fixtures.gerar_modelo(os.path.join(diretorio, "modelo.pptx"), slides, placeholders)
+    for tamanho, linhas in fixtures.TAMANHOS_PLANILHA.items():
+        with open(os.path.join(diretorio, f"planilha_{tamanho}.xlsx"), "wb") as f:
+            f.write(fixtures.gerar_planilha(linhas))
+    with open(os.path.join(diretorio, "planilha_tabela_longa.xlsx"), "wb") as f:
+        f.write(fixtures.gerar_planilha(linhas_tabela=fixtures.LINHAS_TABELA_LONGA))
+    for nome_logo, resolucao in fixtures.RESOLUCOES_LOGO.items():
+        with open(os.path.join(diretorio, f"logo_{nome_logo}.png"), "wb") as f:
+            f.write(fixtures.gerar_logo(*resolucao))
+
+
+def _ler(caminho):
+    with open(caminho, "rb") as f:
+        return f.read()
+
+
+def executar_caso(nome, repeticoes, substitutos, diretorio):
+    """Roda um caso neste processo e devolve o resultado (chamado no processo filho)."""
+    if substitutos:
+        instalar_substitutos()
+    PPT.template_cache = PPT.CacheTemplate(os.path.join(diretorio, "modelo.pptx"))
+    PPT.template_cache.obter()
+    contexto = {
+        "planilhas": {tamanho: _ler(os.path.join(diretorio, f"planilha_{tamanho}.xlsx"))
+                      for tamanho in fixtures.TAMANHOS_PLANILHA},
+        "logos": {nome_logo: _ler(os.path.join(diretorio, f"logo_{nome_logo}.png"))
+                  for nome_logo in fixtures.RESOLUCOES_LOGO},
+        "tabela_longa": _ler(os.path.join(diretorio, "planilha_tabela_longa.xlsx")),
+    }
+    caso = CASOS[nome]
+    argumento = caso.preparar(contexto)
+    caso.executar(argumento)  # aquecimento
+    tempos = []
+    for _ in range(repeticoes):
+        if nome in PREPARAR_A_CADA_REPETICAO:
+            argumento = caso.preparar(contexto)
+        inicio = time.perf_counter()
+        caso.executar(argumento)
+        tempos.append(time.perf_counter() - inicio)
+
+    tempos.sort()
+    mediana = statistics.median(tempos)
+    return {
+        "mediana_ms": round(mediana * 1000, 3),
+        "p95_ms": round(tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))] * 1000, 3),
+        "minimo_ms": round(tempos[0] * 1000, 3),
+        "por_segundo": round(caso.unidades / mediana, 2) if mediana else None,
+        "pico_rss_mb": pico_rss_mb(),
+    }
+
+
+def comparar(resultados, baseline, limite):
+    """Lista de (caso, métrica, valor da baseline, valor atual) que pioraram além do limite."""
+    regressoes = []
+    for nome, atual in resultados.items():
+        anterior = baseline.get("casos", {}).get(nome)
+        if not anterior:
+            continue
+        for metrica in ("mediana_ms", "pico_rss_mb"):
+            if anterior.get(metrica) and atual.get(metrica) and atual[metrica] > anterior[metrica] * (1 + limite):
+                regressoes.append((nome, metrica, anterior[metrica], atual[metrica]))
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticoes", type=int, default=10)
+    parser.add_argument("--casos", help="Casos separados por vírgula; padrão: todos")
+    parser.add_argument("--slides", type=int, default=30)
+    parser.add_argument("--placeholders", type=int, default=8, help="Placeholders por slide no modelo sintético")
+    parser.add_argument("--substitutos", action="store_true", help="Usa os substitutos mesmo com LibreOffice/poppler instalados")
+    parser.add_argument("--baseline", help="JSON de uma rodada anterior para comparar")
+    parser.add_argument("--limite", type=float, default=0.15, help="Piora relativa tolerada (0.15 = 15%%)")
+    parser.add_argument("--salvar-baseline", help="Grava os resultados desta rodada neste JSON")
+    parser.add_argument("--executar-caso", help=argparse.SUPPRESS)
+    parser.add_argument("--fixtures", help=argparse.SUPPRESS)
+    parser.add_argument("--gerar-fixtures", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    substitutos = args.substitutos or not (shutil.which("soffice") and shutil.which("pdftoppm"))
+    if args.gerar_fixtures:
+        gerar_fixtures(args.gerar_fixtures, args.slides, args.placeholders)
+        return
+    if args.executar_caso:
+        resultado = executar_caso(args.executar_caso, args.repeticoes, substitutos, args.fixtures)
+        print(json.dumps(resultado))
+        return
+
+    nomes = args.casos.split(",") if args.casos else list(CASOS)
+    desconhecidos = [nome for nome in nomes if nome not in CASOS]
+    if desconhecidos:
+        parser.error(f"casos desconhecidos: {', '.join(desconhecidos)}")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print(f"{len(nomes)} casos, {args.repeticoes} repetições, modelo com {args.slides} slides"
+          f"{' (LibreOffice/poppler substituídos)' if substitutos else ''}")
+    resultados = {}
+    with tempfile.TemporaryDirectory() as diretorio:
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--gerar-fixtures", diretorio,
+                        "--slides", str(args.slides), "--placeholders", str(args.placeholders)],
+                       capture_output=True, check=True)
+        for nome in nomes:
+            comando = [sys.executable, os.path.abspath(__file__), "--executar-caso", nome,
+                       "--repeticoes", str(args.repeticoes), "--fixtures", diretorio]
+            if substitutos:
+                comando.append("--substitutos")
+            saida = subprocess.run(comando, capture_output=True, text=True, check=True).stdout
+            resultados[nome] = json.loads(saida.strip().splitlines()[-1])
+            r = resultados[nome]
+            comparacao = ""
+            if baseline and nome in baseline.get("casos", {}):
+                anterior = baseline["casos"][nome]["mediana_ms"]
+                comparacao = f" | {r['mediana_ms'] / anterior - 1:+7.1%} vs baseline"
+            print(f"{nome:>32}: mediana {r['mediana_ms']:9.2f} ms | p95 {r['p95_ms']:9.2f} ms | "
+                  f"{r['por_segundo'] or 0:9.1f}/s | RSS {r['pico_rss_mb'] or 0:7.1f} MB{comparacao}")
+
+    documento = {
+        "ambiente": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "substitutos": substitutos,
+            "repeticoes": args.repeticoes,
+            "slides": args.slides,
+            "placeholders": args.placeholders,
+            "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "casos": resultados,
+    }
+    if args.salvar_baseline:
+        with open(args.salvar_baseline, "w", encoding="utf-8") as f:
+            json.dump(documento, f, ensure_ascii=False, indent=2)
+        print(f"Baseline gravada em {args.salvar_baseline}")
+
+    if baseline:
+        regressoes = comparar(resultados, baseline, args.limite)
+        for nome, metrica, anterior, atual in regressoes:
+            print(f"REGRESSÃO: {nome} {metrica} {anterior} -> {atual} (limite {args.limite:.0%})")
+        if regressoes:
+            sys.exit(1)
+        print(f"Sem regressões acima de {args.limite:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
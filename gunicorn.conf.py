@@ -0,0 +1,53 @@
+"""
+Configuração do gunicorn para produção:
+
+  gunicorn -c gunicorn.conf.py PPT:app      (ou: python PPT.py servir)
+
+O app é importado e aquecido (modelo e índice de placeholders em memória, PIL e
+pdf2image carregados) uma única vez no processo mestre, antes do fork; os workers
+compartilham essas páginas por copy-on-write, e cada worker reciclado nasce do mesmo
+mestre já aquecido. Os valores vêm das variáveis SERVIDOR_* lidas pelo PPT.py.
+
+Jobs (/jobs) e sessões de planilha ficam na memória do worker, por isso o padrão é
+um único worker, nunca reciclado, com várias threads: a montagem dos jobs e dos
+lotes já roda nos pools de JOBS_PROCESSOS e LOTE_PROCESSOS. Com SERVIDOR_PROCESSOS
+acima de 1, o balanceador precisa de afinidade de sessão, senão um GET /jobs/<id>
+pode cair num worker que não conhece o job; com SERVIDOR_MAX_REQUISICOES acima de 0,
+os jobs em andamento se perdem quando o worker é reciclado.
+"""
+import gc
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import PPT  # noqa: E402
+
+wsgi_app = "PPT:app"
+bind = [PPT.SERVIDOR_ENDERECO]
+workers = PPT.SERVIDOR_PROCESSOS
+# gthread: as threads de cada worker atendem em paralelo o que libera o GIL
+# (LibreOffice, poppler, E/S e a espera pelos pools de jobs e lote)
+worker_class = "gthread"
+threads = PPT.SERVIDOR_THREADS
+preload_app = True
+max_requests = PPT.SERVIDOR_MAX_REQUISICOES
+# Espalha as reciclagens para os workers não reiniciarem todos juntos
+max_requests_jitter = max_requests // 10
+timeout = PPT.SERVIDOR_TIMEOUT
+graceful_timeout = PPT.SERVIDOR_TIMEOUT
+accesslog = "-"
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+
+def when_ready(server):
+    # Roda no mestre depois de carregar o app e antes do primeiro fork
+    PPT.aquecer()
+    # Tira os objetos já criados do coletor: as varreduras nos workers não tocam mais
+    # nessas páginas, que continuam compartilhadas em vez de copiadas
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    PPT.apos_fork()